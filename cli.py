@@ -0,0 +1,236 @@
+"""Command-line batch mode for PhotoBatch.
+
+Runs the same naming rules as the GUI preview without starting Tk, so it
+can be used from scheduled ingest jobs:
+
+    python renaming.py ~/cards/A ~/cards/B "~/dumps/**/*.jpg" -n Shoot -f underscore -o /exports
+"""
+import argparse
+import os
+import sys
+
+import duplicates
+import engine
+import journal
+import library
+import similar
+
+
+def build_parser():
+    """Argument parser for the batch mode"""
+    parser = argparse.ArgumentParser(
+        prog="renaming.py",
+        description="Batch-rename images into <export-dir>/<name> without opening the GUI."
+    )
+    parser.add_argument('sources', nargs='+',
+                        help="image files, folders or glob patterns (use quotes for **)")
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help="include images in subfolders of folder sources")
+    parser.add_argument('-n', '--name', required=True,
+                        help="base name for the exported files and output folder")
+    parser.add_argument('-f', '--format', default='parentheses',
+                        choices=list(engine.NAME_FORMATS),
+                        help="naming format (default: parentheses)")
+    parser.add_argument('-s', '--sort', default='path', choices=list(engine.SORT_MODES),
+                        help="numbering order: path, natural (file name, numbers by value), "
+                             "captured (EXIF time), modified or size (default: path)")
+    parser.add_argument('-o', '--export-dir', default=None,
+                        help="folder the output folder is created in (default: app directory)")
+    parser.add_argument('-m', '--mode', default='copy', choices=list(engine.EXPORT_MODES),
+                        help="copy, reflink (copy-on-write clone) or hardlink; "
+                             "falls back to copy where unsupported (default: copy)")
+    parser.add_argument('--group-similar', action='store_true',
+                        help="number near-duplicate images (bursts, re-saved copies) next to "
+                             "each other; needs Pillow and NumPy")
+    parser.add_argument('-d', '--duplicates', default='keep', choices=list(engine.DUPLICATE_MODES),
+                        help="files identical to an earlier one: keep (export them too), skip, "
+                             "or link (hard link to the earlier copy) (default: keep)")
+    parser.add_argument('--verify', action='store_true',
+                        help="checksum each copy while writing it and read it back; sources are "
+                             "only deleted once their copy matches, results go to "
+                             f"{engine.MANIFEST_NAME} in the output folder")
+    parser.add_argument('--on-conflict', default='abort', choices=list(engine.CONFLICT_MODES),
+                        help="when a name already exists in the output folder: abort, resume, "
+                             "skip, suffix (export as 'name (2).ext') or newer (replace it if the "
+                             "source is newer) (default: abort)")
+    parser.add_argument('--resume', dest='on_conflict', action='store_const', const='resume',
+                        help="continue an interrupted export: files already in the output folder "
+                             "that match their source (size and mtime, or checksum with --verify) "
+                             "are kept and only the rest are copied (same as --on-conflict resume)")
+    parser.add_argument('--sync', action='store_true',
+                        help="update an earlier export in place: only new or changed sources are "
+                             "copied, exported files keep their names")
+    parser.add_argument('--prune', action='store_true',
+                        help="with --sync, delete exported files whose source is no longer "
+                             "selected (cannot be undone)")
+    parser.add_argument('--delete-originals', action='store_true',
+                        help="delete each source after it has been exported (cannot be undone)")
+    parser.add_argument('-j', '--workers', type=int, default=engine.DEFAULT_WORKERS,
+                        help=f"parallel copy threads (default: {engine.DEFAULT_WORKERS})")
+    parser.add_argument('--device-limit', type=int, default=None,
+                        help="max concurrent copies reading from one source device (default: no limit)")
+    parser.add_argument('--index', nargs='?', const='', default=None, metavar='DB',
+                        help="remember scanned files in an SQLite index so rescans only re-read "
+                             "changed files (default location if DB is omitted)")
+    parser.add_argument('--no-journal', action='store_true',
+                        help="don't record the job in the export journal (the GUI's History "
+                             "can then not undo or recover it)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="print the plan without touching any files")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="only print the summary line")
+    return parser
+
+
+def main(argv=None):
+    """Entry point; returns the process exit code"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.prune and not args.sync:
+        parser.error("--prune needs --sync")
+
+    index = None
+    if args.index is not None:
+        if not library.SQLITE_AVAILABLE:
+            print("Error: --index needs Python's sqlite3 module", file=sys.stderr)
+            return 1
+        index = library.LibraryIndex(os.path.expanduser(args.index) or None)
+
+    files = engine.scan_images(engine.collect_paths(
+        [os.path.expanduser(s) for s in args.sources], recursive=args.recursive),
+        workers=args.workers, sort=args.sort, index=index)
+    if not files:
+        print("No image files found.", file=sys.stderr)
+        return 1
+
+    if args.group_similar:
+        if not similar.SIMILAR_AVAILABLE:
+            print("Error: --group-similar needs Pillow and NumPy", file=sys.stderr)
+            return 1
+        groups = similar.find_similar(files, workers=args.workers)
+        files = similar.group_together(files, groups)
+        if not args.quiet:
+            print(f"Grouped {sum(len(g) for g in groups)} similar images in {len(groups)} clusters")
+
+    originals = {}
+    if args.duplicates != 'keep':
+        groups = duplicates.find_duplicates(files, workers=args.workers, index=index)
+        originals = duplicates.duplicate_map(groups)
+        if not args.quiet:
+            print(f"Found {len(originals)} duplicate files in {len(groups)} groups")
+
+    try:
+        plan = engine.plan_rename(files, args.name, args.format,
+                                  skip=set(originals) if args.duplicates == 'skip' else None)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    output_dir = engine.resolve_output_dir(
+        args.name.strip(), args.export_dir and os.path.expanduser(args.export_dir))
+
+    sync = None
+    if args.sync:
+        sync = engine.plan_sync(plan, output_dir, args.name.strip(), args.format, workers=args.workers)
+        if not args.quiet:
+            print(f"Sync: {len(sync.copy)} new or changed, {len(sync.unchanged)} unchanged, "
+                  f"{len(sync.stale)} stale")
+
+    if args.dry_run and sync is not None:
+        if not args.quiet:
+            for old_path, new_name in sync.copy:
+                print(f"{old_path} -> {os.path.join(output_dir, new_name)}")
+            if args.prune:
+                for path in sync.stale:
+                    print(f"{path} (stale, removed)")
+        print(f"Dry run: {len(sync.copy)} files would be exported to {output_dir}")
+        return 0
+
+    if args.dry_run:
+        existing = engine.output_names(output_dir)
+        collisions = set(engine.find_collisions(plan, output_dir, existing))
+        resolved, _ = engine.resolve_conflicts(plan, existing, args.on_conflict)
+        if not args.quiet:
+            for (old_path, new_name), (_, final_name) in zip(plan, resolved):
+                if new_name is None:
+                    print(f"{old_path} (duplicate of {originals[old_path]}, skipped)")
+                elif new_name not in collisions:
+                    print(f"{old_path} -> {os.path.join(output_dir, new_name)}")
+                elif final_name is None:
+                    print(f"{old_path} (exists as {new_name}, skipped)")
+                else:
+                    print(f"{old_path} -> {os.path.join(output_dir, final_name)} "
+                          f"(exists as {new_name}, {args.on_conflict})")
+        exported = sum(1 for _, new_name in resolved if new_name is not None)
+        print(f"Dry run: {exported} files would be exported to {output_dir}")
+        if collisions:
+            print(f"{len(collisions)} names already exist there (--on-conflict {args.on_conflict})")
+        return 0
+
+    def report(done, total, new_path, nbytes):
+        if not args.quiet:
+            print(f"[{done}/{total}] {new_path}", flush=True)
+
+    log = None
+    if not args.no_journal:
+        try:
+            log = journal.Journal().start()
+        except OSError as e:
+            print(f"Warning: export journal unavailable: {e}", file=sys.stderr)
+
+    options = dict(delete_originals=args.delete_originals,
+                   progress=report,
+                   workers=args.workers,
+                   device_limit=args.device_limit,
+                   mode=args.mode,
+                   link_duplicates=originals if args.duplicates == 'link' else None,
+                   verify=args.verify,
+                   log=log)
+    try:
+        if sync is not None:
+            record = engine.sync_export(sync, output_dir, prune=args.prune, **options)
+        else:
+            record = engine.execute_plan(plan, output_dir, on_conflict=args.on_conflict, **options)
+    except engine.CollisionError as e:
+        print(f"Error: {len(e.collisions)} files already exist in {output_dir}:", file=sys.stderr)
+        for name in e.collisions[:10]:
+            print(f"  {name}", file=sys.stderr)
+        if len(e.collisions) > 10:
+            print("  ...", file=sys.stderr)
+        print("Use --resume to continue an interrupted export, or --on-conflict to skip, "
+              "rename or replace existing files.", file=sys.stderr)
+        return 1
+    except Exception as e:
+        partial = getattr(e, 'record', None)
+        done = len(partial['changes']) if partial else 0
+        print(f"Error during export after {done} files: {e}", file=sys.stderr)
+        return 1
+
+    for old_path, error in record['errors']:
+        print(f"{old_path}: {error}", file=sys.stderr)
+
+    summary = f"Exported {len(record['changes'])} files to {output_dir}"
+    if record['resumed']:
+        summary += f", {record['resumed']} already there"
+    if record['skipped']:
+        summary += f", {record['skipped']} existing kept"
+    if sync is not None:
+        summary += f", {record['unchanged']} unchanged"
+        if args.prune:
+            summary += f", {record['pruned']} stale removed"
+    if args.delete_originals:
+        summary += f", deleted {record['deleted_count']} originals"
+        if record['moves']:
+            summary += f", {len(record['moves'])} moved in place"
+    if args.verify:
+        summary += f", {record['verified']} verified"
+    if (args.mode != 'copy' or args.duplicates == 'link') and record['methods']:
+        summary += ", " + ", ".join(f"{count} {method}" for method, count in sorted(record['methods'].items()))
+    mb = record['bytes'] / (1024 * 1024)
+    summary += f" ({mb:.1f} MB in {record['elapsed']:.1f}s, {mb / max(record['elapsed'], 1e-6):.1f} MB/s)"
+    print(summary)
+    return 1 if record['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
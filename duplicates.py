@@ -0,0 +1,130 @@
+"""Exact duplicate detection by staged hashing.
+
+Files can only be identical if their sizes match, so candidates are
+grouped by size first (a stat each), then by a hash of their first and
+last blocks, and only files that still collide are hashed in full. Most
+photos never get past the size check and almost none need the full read.
+Hashing runs on a thread pool.
+"""
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import fastcopy
+import metadata
+
+# Bytes hashed from each end of a file in the partial stage
+PARTIAL_BLOCK = 64 * 1024
+
+# Parallel hashing threads used by default
+DEFAULT_WORKERS = 4
+
+
+def partial_hash(path, size):
+    """Hash of the first and last PARTIAL_BLOCK bytes; the whole file if small"""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        digest.update(f.read(PARTIAL_BLOCK))
+        if size > 2 * PARTIAL_BLOCK:
+            f.seek(size - PARTIAL_BLOCK)
+        digest.update(f.read(PARTIAL_BLOCK))
+    return digest.hexdigest()
+
+
+def full_hash(path):
+    """blake2b hex digest of the whole file"""
+    return fastcopy.checksum(path)
+
+
+def _refine(groups, key_fn, workers, cancel):
+    """Split each group by key_fn(member) in parallel; keeps groups of 2+"""
+    members = [m for group in groups for m in group]
+    if not members or (cancel is not None and cancel.is_set()):
+        return []
+
+    def safe_key(member):
+        if cancel is not None and cancel.is_set():
+            return None
+        try:
+            return key_fn(member)
+        except OSError:
+            return None
+
+    if workers and workers > 1 and len(members) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            keys = list(pool.map(safe_key, members))
+    else:
+        keys = [safe_key(m) for m in members]
+
+    split = {}
+    pos = 0
+    for n, group in enumerate(groups):
+        for member in group:
+            key = keys[pos]
+            pos += 1
+            if key is not None:
+                split.setdefault((n, key), []).append(member)
+    return [group for group in split.values() if len(group) > 1]
+
+
+def find_duplicates(paths, workers=DEFAULT_WORKERS, index=None, cancel=None):
+    """Groups of paths with identical content, each a list of 2+ paths.
+
+    Members and groups keep the order of paths, so the first member of a
+    group is the one that comes first in the list. With a
+    library.LibraryIndex, full hashes already stored are reused and new
+    ones are written back. cancel may be a threading.Event; a cancelled
+    search returns no groups.
+    """
+    paths = list(paths)
+    if index is not None:
+        infos = index.lookup(paths, workers=workers)
+        entries = [(n, p, info.size, info.mtime_ns, info.hash)
+                   for n, (p, info) in enumerate(zip(paths, infos)) if info is not None]
+    else:
+        stats = metadata.map_batches(
+            lambda batch: [metadata.read_stat(p) for p in batch], paths, workers)
+        entries = [(n, p, st.st_size, st.st_mtime_ns, None)
+                   for n, (p, st) in enumerate(zip(paths, stats)) if st is not None]
+
+    # Stage 1: sizes (empty files carry no content worth flagging)
+    by_size = {}
+    for entry in entries:
+        if entry[2] > 0:
+            by_size.setdefault(entry[2], []).append(entry)
+    groups = [group for group in by_size.values() if len(group) > 1]
+
+    # Stage 2: first and last blocks
+    groups = _refine(groups, lambda e: partial_hash(e[1], e[2]), workers, cancel)
+
+    # Stage 3: full content, only where the partial hash didn't cover it all
+    small = [g for g in groups if g[0][2] <= 2 * PARTIAL_BLOCK]
+    large = [g for g in groups if g[0][2] > 2 * PARTIAL_BLOCK]
+    hashed = {}
+
+    def content_key(entry):
+        digest = entry[4] or full_hash(entry[1])
+        hashed[entry[1]] = (entry, digest)
+        return digest
+
+    groups = small + _refine(large, content_key, workers, cancel)
+    if cancel is not None and cancel.is_set():
+        return []
+
+    if index is not None:
+        fresh = [(path, entry[2], entry[3], digest)
+                 for path, (entry, digest) in hashed.items() if entry[4] is None]
+        if fresh:
+            index.set_hashes(fresh)
+
+    groups = [sorted(group) for group in groups]
+    groups.sort()
+    return [[entry[1] for entry in group] for group in groups]
+
+
+def duplicate_map(groups):
+    """{duplicate path: first path of its group} for every later member"""
+    originals = {}
+    for group in groups:
+        for path in group[1:]:
+            originals[path] = group[0]
+    return originals
@@ -0,0 +1,1231 @@
+"""Headless rename/export engine for PhotoBatch.
+
+Everything in here works on plain paths and values, with no Tk widgets
+involved, so the same rules can be driven from the GUI, from scripts or
+from a headless ingest box.
+
+Typical use:
+
+    files = scan_images(paths)
+    plan = plan_rename(files, "Shoot", "underscore")
+    output_dir = resolve_output_dir("Shoot")
+    record = execute_plan(plan, output_dir)
+    ...
+    undo_export(record)
+"""
+import contextlib
+import errno
+import glob
+import itertools
+import json
+import os
+import re
+import shutil
+import stat
+import sys
+import threading
+import time
+from collections.abc import Sequence
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except Exception:
+    FCNTL_AVAILABLE = False
+
+import fastcopy
+import formats
+import metadata
+
+# Extensions offered in file dialogs; selections are filtered by content
+VALID_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.tif',
+                    '.heic', '.heif', '.avif', '.jxl', '.dng', '.cr2', '.cr3', '.nef', '.arw',
+                    '.orf', '.rw2', '.raf')
+
+# Naming formats, keyed by the value used in the GUI radio buttons
+NAME_FORMATS = {
+    'parentheses': "{base} ({index}){ext}",
+    'underscore': "{base}_{index}{ext}",
+    'dash': "{base}-{index}{ext}",
+    'space': "{base} {index}{ext}",
+}
+
+# Orders for numbering, keyed by the value used in the GUI and CLI:
+#   path     - full path, alphabetical (the classic order)
+#   natural  - file name with numbers compared by value (IMG_2 before IMG_10)
+#   captured - EXIF capture time, falling back to mtime for files without one
+#   modified - file modification time
+#   size     - file size, smallest first
+SORT_MODES = ('path', 'natural', 'captured', 'modified', 'size')
+
+# Parallel header readers used for metadata sorts
+SORT_WORKERS = 8
+
+# How exported files are created when originals are kept:
+#   copy     - a full independent copy (always works, see fastcopy)
+#   reflink  - copy-on-write clone on btrfs/XFS, falls back to copy
+#   hardlink - another name for the same data, falls back to copy
+EXPORT_MODES = ('copy', 'reflink', 'hardlink')
+
+# What to do with files whose content duplicates an earlier file in the plan:
+#   keep - export them like any other file
+#   skip - leave them out of the export and the numbering
+#   link - export them as hard links to the earlier file's copy
+DUPLICATE_MODES = ('keep', 'skip', 'link')
+
+# What to do when a planned name already exists in the output folder:
+#   abort  - stop before anything is copied (CollisionError)
+#   resume - keep it if it is a finished copy of its source, else export again
+#   skip   - keep the existing file and leave the source out
+#   suffix - export under the next free "name (n).ext" instead
+#   newer  - replace the existing file if the source is newer, else skip it
+CONFLICT_MODES = ('abort', 'resume', 'skip', 'suffix', 'newer')
+
+# Platforms whose default filesystems (NTFS, APFS/HFS+) ignore case, so
+# names that differ only in case are the same file
+CASE_INSENSITIVE = sys.platform in ('win32', 'darwin')
+
+# Per-file results of a verified export, written into its output folder
+MANIFEST_NAME = '.photobatch-manifest.jsonl'
+
+# Largest mtime difference (ns) for an existing target on a filesystem
+# that rounds to whole seconds (FAT and some SMB servers keep 2 s steps)
+# to count as a finished copy of its source
+MTIME_TOLERANCE_NS = 2 * 10**9
+
+# Linux ioctl number for FICLONE (_IOW(0x94, 9, int))
+FICLONE = 0x40049409
+
+# Parallel copies used by default; storage rarely saturates with one stream
+DEFAULT_WORKERS = 4
+
+# Most files removed or moved back per task when undoing an export
+UNDO_BATCH = 256
+
+# Undo tasks per worker thread, for regular progress on small undos too
+UNDO_TASKS_PER_WORKER = 4
+
+
+# os.rename errors on which a move falls back to copy and delete
+MOVE_FALLBACK_ERRNOS = (errno.EXDEV, errno.EACCES, errno.EPERM)
+
+# Error recorded for a verified copy that differs from its source
+CHECKSUM_MISMATCH = "copy does not match the source checksum"
+
+# Error recorded for a file whose new name is taken by a folder
+FOLDER_IN_THE_WAY = "a folder with the new name is in the way"
+
+
+class ExportError(Exception):
+    """Raised when an export cannot be started or completed"""
+
+
+class CollisionError(ExportError):
+    """Raised when planned targets already exist in the output folder"""
+
+    def __init__(self, collisions):
+        self.collisions = list(collisions)
+        super().__init__(f"{len(self.collisions)} target file(s) already exist")
+
+
+def default_export_base():
+    """Default export location (the application directory)"""
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def resolve_output_dir(base_name, export_base=None):
+    """Output folder for a job: <export_base>/<base_name>"""
+    return os.path.join(export_base or default_export_base(), base_name)
+
+
+def walk_files(roots, recursive=True, cancel=None):
+    """Yield file paths under roots as they are found.
+
+    An iterative os.scandir walk: no recursion limit, one directory handle
+    open at a time, and results stream out while the walk is still going,
+    so callers can show the first files of a 500k-file tree immediately.
+    Unreadable directories are skipped; symlinked directories are not
+    followed. cancel may be a threading.Event that stops the walk.
+    """
+    stack = list(reversed(roots))
+    while stack:
+        if cancel is not None and cancel.is_set():
+            return
+        top = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(top) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                subdirs.append(entry.path)
+                        elif entry.is_file():
+                            yield entry.path
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        # Depth-first, in listing order
+        stack.extend(reversed(subdirs))
+
+
+def iter_batches(iterable, size):
+    """Group an iterable into lists of at most size items"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def collect_paths(sources, recursive=False):
+    """Expand files, directories and glob patterns into a list of file paths.
+
+    Directories contribute their direct children, or their whole tree with
+    recursive; patterns are expanded with glob (``**`` is recursive).
+    """
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(walk_files([source], recursive=recursive))
+        elif os.path.isfile(source):
+            paths.append(source)
+        else:
+            paths.extend(p for p in glob.glob(source, recursive=True) if os.path.isfile(p))
+    return paths
+
+
+def filter_images(paths, workers=None, index=None):
+    """Keep only image files from paths, in their original order.
+
+    Files are recognised by content (see formats), not by extension. With
+    a library.LibraryIndex, unchanged files are answered from the index.
+    """
+    if index is not None:
+        paths = list(paths)
+        infos = index.lookup(paths, workers=workers)
+        return [p for p, info in zip(paths, infos) if info is not None and info.format]
+    return formats.filter_images(paths, workers=workers)
+
+
+def natural_key(path):
+    """Sort key comparing digit runs in the file name as numbers"""
+    parts = re.split(r'(\d+)', os.path.basename(path).casefold())
+    parts[1::2] = [int(p) for p in parts[1::2]]
+    return parts, path
+
+
+def sort_images(files, mode='path', workers=SORT_WORKERS, index=None):
+    """Return files ordered by one of SORT_MODES; ties keep natural order.
+
+    'captured', 'modified' and 'size' read file metadata in parallel
+    batches (see metadata), or from a library.LibraryIndex if one is
+    given; files that can't be read sort last.
+    """
+    if mode not in SORT_MODES:
+        raise ValueError(f"Unknown sort mode: {mode}")
+    if mode == 'path':
+        return sorted(files)
+    if mode == 'natural':
+        return sorted(files, key=natural_key)
+
+    if index is not None:
+        values = [_indexed_sort_value(info, mode) for info in index.lookup(files, workers=workers)]
+    else:
+        info = metadata.read_many(files, capture_times=(mode == 'captured'), workers=workers)
+        values = [_sort_value(st, taken, mode) for st, taken in info]
+    return _order_by(files, values)
+
+
+def _order_by(files, values):
+    """files sorted by values (None last), ties in natural order"""
+    keyed = [((value is None, value or 0), natural_key(path), path)
+             for path, value in zip(files, values)]
+    keyed.sort()
+    return [path for _, _, path in keyed]
+
+
+def _sort_value(st, taken, mode):
+    if st is None:
+        return None
+    if mode == 'size':
+        return st.st_size
+    if taken is not None:
+        return taken.timestamp()
+    return st.st_mtime
+
+
+def _indexed_sort_value(info, mode):
+    if info is None:
+        return None
+    if mode == 'size':
+        return info.size
+    if mode == 'captured' and info.captured is not None:
+        return info.captured
+    return info.mtime_ns / 1e9
+
+
+def scan_images(paths, workers=None, sort='path', index=None):
+    """Keep only image files from paths, sorted for stable numbering"""
+    if index is None or sort in ('path', 'natural'):
+        files = filter_images(paths, workers=workers, index=index)
+        return sort_images(files, sort)
+
+    # One index pass answers both the format and the sort key
+    if sort not in SORT_MODES:
+        raise ValueError(f"Unknown sort mode: {sort}")
+    paths = list(paths)
+    infos = index.lookup(paths, workers=workers)
+    kept = [(p, info) for p, info in zip(paths, infos) if info is not None and info.format]
+    return _order_by([p for p, _ in kept], [_indexed_sort_value(info, sort) for _, info in kept])
+
+
+def format_name(base_name, index, ext, format_type):
+    """Build a new file name; unknown formats fall back to 'space'"""
+    template = NAME_FORMATS.get(format_type, NAME_FORMATS['space'])
+    return template.format(base=base_name, index=index, ext=ext)
+
+
+class RenamePlan(Sequence):
+    """Rename plan whose entries are built on demand.
+
+    Item i is (files[i], new name for position i + 1). Nothing is computed
+    up front, so building a plan for 500k files or renumbering after
+    removing rows from ``files`` is instant; the plan always reflects the
+    current contents of the list it was given.
+
+    Files in ``skip`` stay in the plan with a new name of None and are not
+    counted, so the numbering runs on without gaps; their positions are
+    recounted whenever the length of ``files`` changes.
+    """
+
+    def __init__(self, files, base_name, format_type, skip=None):
+        self.files = files
+        self.base_name = base_name
+        self.format_type = format_type
+        self.skip = skip or None
+        self.numbers = None
+
+    def __len__(self):
+        return len(self.files)
+
+    def number(self, index):
+        """Position of files[index] in the numbering, or None if skipped"""
+        if self.skip is None:
+            return index + 1
+        if self.numbers is None or len(self.numbers) != len(self.files):
+            numbers = []
+            count = 0
+            for path in self.files:
+                if path in self.skip:
+                    numbers.append(None)
+                else:
+                    count += 1
+                    numbers.append(count)
+            self.numbers = numbers
+        return self.numbers[index]
+
+    def target_count(self):
+        """Number of files that get a new name"""
+        if self.skip is None or not self.files:
+            return len(self.files)
+        self.number(0)
+        return sum(1 for number in self.numbers if number is not None)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        file_path = self.files[index]
+        number = self.number(index)
+        if number is None:
+            return file_path, None
+        ext = os.path.splitext(os.path.basename(file_path))[1]
+        return file_path, format_name(self.base_name, number, ext, self.format_type)
+
+
+def plan_rename(files, base_name, format_type, skip=None):
+    """Return the rename plan, a sequence of (source_path, new_name).
+
+    skip is an optional set of source paths to leave out (see RenamePlan).
+    """
+    base_name = base_name.strip()
+    if not base_name:
+        raise ValueError("Base name must not be empty")
+    return RenamePlan(files, base_name, format_type, skip)
+
+
+def name_key(name):
+    """name as the output filesystem compares it (case-folded where case is ignored)"""
+    return name.casefold() if CASE_INSENSITIVE else name
+
+
+def output_names(folder):
+    """Names taken in folder, from a single directory scan, as name_key values.
+
+    One os.scandir pass instead of a stat per planned name, which matters
+    on network shares where every call is a round trip. Every entry counts,
+    including folders and symlinks: writing through a symlink would
+    overwrite whatever it points to. A missing folder has no names.
+    """
+    try:
+        with os.scandir(folder) as entries:
+            return {name_key(entry.name) for entry in entries}
+    except FileNotFoundError:
+        return set()
+
+
+def find_collisions(plan, output_dir, existing=None):
+    """Names from the plan that already exist in output_dir.
+
+    existing may be a set from output_names taken earlier, e.g. for the
+    preview; otherwise the folder is scanned once.
+    """
+    if existing is None:
+        existing = output_names(output_dir)
+    return [new_name for _, new_name in plan
+            if new_name is not None and name_key(new_name) in existing]
+
+
+def free_name(name, taken):
+    """name, or "stem (n).ext" with the lowest n >= 2 whose name_key is not in taken"""
+    if name_key(name) not in taken:
+        return name
+    stem, ext = os.path.splitext(name)
+    n = 2
+    while name_key(f"{stem} ({n}){ext}") in taken:
+        n += 1
+    return f"{stem} ({n}){ext}"
+
+
+def resolve_conflicts(plan, existing, on_conflict, taken=None):
+    """Plan with the 'skip' and 'suffix' strategies applied up front.
+
+    existing holds the name_key values of colliding names and taken those
+    of every name in the output folder (see output_names), so a suffixed
+    name never lands on a file left by an earlier run; taken defaults to
+    existing. Returns (plan, skipped names). Colliding entries get a new
+    name of None for skip or the next free suffixed name for suffix; other
+    modes are handled per file while exporting and leave the plan as it is.
+    """
+    if on_conflict not in ('skip', 'suffix') or not existing:
+        return plan, []
+    taken = set(existing if taken is None else taken)
+    taken.update(name_key(new_name) for _, new_name in plan if new_name is not None)
+    resolved = []
+    skipped = []
+    for old_path, new_name in plan:
+        if new_name is not None and name_key(new_name) in existing:
+            if on_conflict == 'skip':
+                skipped.append(new_name)
+                new_name = None
+            else:
+                new_name = free_name(new_name, taken)
+                taken.add(name_key(new_name))
+        resolved.append((old_path, new_name))
+    return resolved, skipped
+
+
+class _DeviceLimiter:
+    """Hands out per-device semaphores so one slow card can't hog every worker"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.slots = {}
+        self.lock = threading.Lock()
+
+    def slot(self, device):
+        if not self.limit:
+            return contextlib.nullcontext()
+        with self.lock:
+            if device not in self.slots:
+                self.slots[device] = threading.BoundedSemaphore(self.limit)
+            return self.slots[device]
+
+
+def _reflink(old_path, new_path):
+    """Clone old_path to new_path with FICLONE; raises OSError if unsupported"""
+    if not FCNTL_AVAILABLE:
+        raise OSError("reflinks are not supported on this platform")
+    with open(old_path, 'rb') as src, open(new_path, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(new_path)
+            raise
+    shutil.copystat(old_path, new_path)
+
+
+def _place_file(old_path, new_path, mode, verify=False):
+    """Create new_path from old_path using mode.
+
+    Returns (method actually used, source checksum). The checksum is only
+    taken for real copies with verify, while the data streams through.
+    """
+    if mode == 'hardlink':
+        try:
+            os.link(old_path, new_path)
+            return 'hardlink', None
+        except OSError:
+            # Different device or filesystem without links
+            pass
+    elif mode == 'reflink':
+        try:
+            _reflink(old_path, new_path)
+            return 'reflink', None
+        except OSError:
+            pass
+    if verify:
+        return 'copy', fastcopy.copy2_hashed(old_path, new_path)
+    fastcopy.copy2(old_path, new_path)
+    return 'copy', None
+
+
+def _export_one(old_path, new_path, delete_originals, limiter, output_dev, mode, verify=False):
+    """Export one file; returns (nbytes, method, delete_error, checksums).
+
+    nbytes is None if the source is gone. With delete_originals, a source on
+    the same device as the output folder is simply renamed into place
+    (method 'move'); anything else is placed according to mode, verified by
+    size and only then deleted.
+
+    With verify, copies are checksummed on the way and read back afterwards;
+    checksums is then (source digest, copy digest) and a source is only
+    deleted if they match. Moves and links share the source's data and are
+    not read back (checksums is None).
+    """
+    try:
+        st = os.stat(old_path)
+    except FileNotFoundError:
+        return None, None, None, None
+
+    if delete_originals and st.st_dev == output_dev:
+        try:
+            os.rename(old_path, new_path)
+            return st.st_size, 'move', None, None
+        except OSError as e:
+            # EXDEV across bind mounts, or a source folder we may read but
+            # not change: fall through to a real copy; its delete then fails
+            # and is reported for this file alone
+            if e.errno not in MOVE_FALLBACK_ERRNOS:
+                raise
+
+    with limiter.slot(st.st_dev):
+        method, source_sum = _place_file(old_path, new_path, mode, verify)
+
+    checksums = None
+    if source_sum is not None:
+        checksums = (source_sum, fastcopy.checksum(new_path, uncached=True))
+
+    delete_error = None
+    if checksums is not None and checksums[0] != checksums[1]:
+        delete_error = CHECKSUM_MISMATCH
+        if delete_originals:
+            delete_error += "; original kept"
+    elif delete_originals:
+        written = os.stat(new_path).st_size
+        if written != st.st_size:
+            delete_error = f"copy is {written} bytes, source is {st.st_size}; original kept"
+        else:
+            try:
+                os.remove(old_path)
+            except OSError as del_err:
+                # Keep going; the copy itself succeeded
+                delete_error = str(del_err)
+    return st.st_size, method, delete_error, checksums
+
+
+def _link_duplicate(old_path, new_path, target, delete_originals, limiter, output_dev, mode,
+                    verify=False):
+    """Export a duplicate as a hard link to its original's exported copy.
+
+    Falls back to a normal export of its own source if linking fails.
+    """
+    try:
+        st = os.stat(old_path)
+    except FileNotFoundError:
+        return None, None, None, None
+    try:
+        os.link(target, new_path)
+    except OSError:
+        return _export_one(old_path, new_path, delete_originals, limiter, output_dev, mode, verify)
+
+    delete_error = None
+    if delete_originals:
+        try:
+            os.remove(old_path)
+        except OSError as del_err:
+            delete_error = str(del_err)
+    return st.st_size, 'duplicate-link', delete_error, None
+
+
+def is_finished_copy(src_st, dst_st):
+    """Whether a target with stat dst_st is a complete copy of src_st.
+
+    Copies and clones get their source's mtime only after all data is
+    written (copystat comes last), so a partial copy never passes. Links
+    share the inode.
+    """
+    if (src_st.st_dev, src_st.st_ino) == (dst_st.st_dev, dst_st.st_ino):
+        return True
+    if src_st.st_size != dst_st.st_size:
+        return False
+    if dst_st.st_mtime_ns % 10**9:
+        return src_st.st_mtime_ns == dst_st.st_mtime_ns
+    return abs(src_st.st_mtime_ns - dst_st.st_mtime_ns) <= MTIME_TOLERANCE_NS
+
+
+def is_linked_duplicate(src_st, dst_st):
+    """Whether a target exported as a duplicate link (see _link_duplicate) is current.
+
+    The link shares its original's copy and so carries that file's mtime,
+    not its source's. It counts as current while it is still a link, the
+    same size as its source, and the source hasn't been modified since the
+    link was made (the inode's ctime).
+    """
+    return (dst_st.st_nlink > 1 and src_st.st_size == dst_st.st_size
+            and src_st.st_mtime_ns <= dst_st.st_ctime_ns)
+
+
+def _resume_one(old_path, new_path, previous, delete_originals, limiter, output_dev, mode,
+                verify=False, link_target=None):
+    """Keep new_path if an earlier run finished it, export it again otherwise.
+
+    Returns an _export_one outcome; method 'resumed' means the existing
+    target was kept. A duplicate is finished when it is a link to
+    link_target (its original's copy), or when the earlier run's manifest
+    entry (previous) says it was linked and it is still current. With
+    verify, the target must also match the source's checksum, taken from
+    the manifest entry when that entry is for the same source and file,
+    read from both otherwise. A folder at new_path is left alone and
+    reported as an error with method 'skipped'.
+    """
+    # lstat: a symlink at the target is never a finished copy
+    dst = os.lstat(new_path)
+    if stat.S_ISDIR(dst.st_mode):
+        return 0, 'skipped', FOLDER_IN_THE_WAY, None
+    try:
+        src = os.stat(old_path)
+    except FileNotFoundError:
+        # Moved or deleted by the earlier run once its copy was done
+        return dst.st_size, 'resumed', None, None
+
+    entry = previous.get(new_path)
+    if entry and entry.get('method') == 'duplicate-link' and entry.get('source') == old_path:
+        finished = is_linked_duplicate(src, dst)
+    else:
+        finished = is_finished_copy(src, dst)
+    if not finished and link_target is not None:
+        with contextlib.suppress(OSError):
+            finished = os.path.samefile(new_path, link_target)
+    if finished:
+        checksums = None
+        if verify:
+            if (entry and entry.get('status') == 'verified' and entry.get('source') == old_path
+                    and entry.get('size') == src.st_size):
+                checksums = (entry['source_checksum'], entry['copy_checksum'])
+            else:
+                with limiter.slot(src.st_dev):
+                    checksums = (fastcopy.checksum(old_path), fastcopy.checksum(new_path, uncached=True))
+        if checksums is None or checksums[0] == checksums[1]:
+            delete_error = None
+            if delete_originals and (src.st_dev, src.st_ino) != (dst.st_dev, dst.st_ino):
+                try:
+                    os.remove(old_path)
+                except OSError as del_err:
+                    delete_error = str(del_err)
+            return src.st_size, 'resumed', delete_error, checksums
+
+    # Partial or stale copy
+    os.remove(new_path)
+    return _export_one(old_path, new_path, delete_originals, limiter, output_dev, mode, verify)
+
+
+def _replace_older(old_path, new_path, previous, delete_originals, limiter, output_dev, mode,
+                   verify=False, link_target=None):
+    """Replace new_path only if old_path was modified after it.
+
+    Returns an _export_one outcome; method 'skipped' means the existing
+    file was as new or newer (or a folder) and was kept. previous and
+    link_target are unused, they are there to match _resume_one.
+    """
+    try:
+        src = os.stat(old_path)
+    except FileNotFoundError:
+        return None, None, None, None
+    dst = os.lstat(new_path)
+    if stat.S_ISDIR(dst.st_mode):
+        return 0, 'skipped', FOLDER_IN_THE_WAY, None
+    if src.st_mtime_ns <= dst.st_mtime_ns:
+        return 0, 'skipped', None, None
+    os.remove(new_path)
+    return _export_one(old_path, new_path, delete_originals, limiter, output_dev, mode, verify)
+
+
+def read_manifest(folder):
+    """Entries of the manifest in folder keyed by target path; {} if there is none"""
+    entries = {}
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[entry.get('target')] = entry
+    except OSError:
+        pass
+    return entries
+
+
+def write_manifest(record, carry=()):
+    """Write the record's per-file results to MANIFEST_NAME in its folder.
+
+    One JSON object per line: source, target, size, method, the source and
+    copy checksums (None unless verified) and a status of 'verified',
+    'mismatch', 'moved', 'linked', 'copied' or 'resumed'. Returns the
+    manifest path. Entries in carry (files an earlier run exported that are
+    still current) are written first. Resumed files keep the method and
+    checksums of their entry in the earlier manifest; their method is None
+    if there was none.
+    """
+    path = os.path.join(record['folder'], MANIFEST_NAME)
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in itertools.chain(carry, record['files']):
+            f.write(json.dumps(entry) + '\n')
+    return path
+
+
+def _prune_manifest(path):
+    """Drop manifest entries whose target is gone; delete the manifest once none are left"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return
+    kept = []
+    for line in lines:
+        try:
+            target = json.loads(line).get('target')
+        except ValueError:
+            continue
+        if target and os.path.lexists(target):
+            kept.append(line)
+    if not kept:
+        os.remove(path)
+    elif len(kept) < len(lines):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(kept)
+
+
+def _removed_source(outcome, delete_originals):
+    """Whether an _export_one outcome left the source gone"""
+    method, delete_error = outcome[1], outcome[2]
+    if method == 'skipped':
+        return False
+    return method == 'move' or (delete_originals and delete_error is None)
+
+
+def execute_plan(plan, output_dir, delete_originals=False, progress=None, cancel=None,
+                 workers=DEFAULT_WORKERS, device_limit=None, mode='copy', link_duplicates=None,
+                 verify=False, log=None, on_conflict='abort', carry=None):
+    """Copy every planned file into output_dir under its new name.
+
+    Files are copied by a pool of ``workers`` threads; ``device_limit``
+    caps how many of them may read from the same source device at once.
+    progress, if given, is called as progress(done, total, new_path, nbytes)
+    from the calling thread as files complete. cancel may be a
+    threading.Event; once it is set no new files are started and the record
+    is returned with ``cancelled`` set.
+
+    mode is one of EXPORT_MODES; hardlinks and reflinks fall back to a real
+    copy per file wherever the filesystem refuses them, and ``methods`` in
+    the record counts what was actually used.
+
+    With delete_originals, sources on the same filesystem as output_dir are
+    moved with a metadata-only rename instead of being copied; their
+    (source, target) pairs are listed in the record's ``moves``. Sources
+    deleted after being copied are listed in ``removed_sources``, so undo
+    can put every original back (see undo_export).
+
+    Plan entries without a new name (skipped duplicates) are left alone.
+    link_duplicates may map a source to another source in the plan with
+    the same content (see duplicates.duplicate_map); such files are
+    exported last, as hard links to the other file's exported copy
+    (method 'duplicate-link').
+
+    With verify, every copy is checksummed while it is written and read
+    back afterwards (see _export_one); a source is only deleted once its
+    copy matches. Mismatches are listed in ``errors``. Per-file results
+    (with checksums only under verify) are in ``files`` and in a manifest
+    in output_dir (see write_manifest), whose path is the record's
+    ``manifest``; plan_sync uses it to find each source's earlier name.
+    carry may list manifest entries of an earlier run to keep (see
+    plan_sync); by default the earlier manifest's entries for files this
+    run left alone are kept.
+
+    log may be a journal.JobLog: the whole plan is written to it before the
+    first file is touched, then each file as it completes and finally the
+    outcome, so the job can be undone or recovered after a restart. Its
+    id is the record's ``job``.
+
+    Existing targets are found with one scan of output_dir and handled
+    according to on_conflict (see CONFLICT_MODES); with 'abort' any of
+    them raises CollisionError before anything is copied. With 'resume',
+    existing targets are taken as left over from an earlier run of the
+    same plan: each one that is a finished copy of its source (same size
+    and mtime, see is_finished_copy; a duplicate link that is still
+    current; with verify also the same checksum) is kept and counted in ``resumed``, anything else is removed and
+    exported again. Files kept by 'skip' and 'newer' are counted in
+    ``skipped``, as are folders in the way of a target, which are also
+    listed in ``errors``. Kept files are not part of ``changes``, so undoing the
+    export leaves them alone; files replaced by 'newer' cannot be restored.
+
+    Returns the undo record for the job. ``changes`` always follows plan
+    order regardless of which worker finished first. The record is also
+    attached to any exception raised mid-way as ``exc.record`` so callers
+    can still undo a partial export.
+    """
+    if mode not in EXPORT_MODES:
+        raise ValueError(f"Unknown export mode: {mode}")
+    if on_conflict not in CONFLICT_MODES:
+        raise ValueError(f"Unknown conflict mode: {on_conflict}")
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    listing = output_names(output_dir)
+    collisions = find_collisions(plan, output_dir, listing)
+    if collisions and on_conflict == 'abort':
+        raise CollisionError(collisions)
+    existing = {name_key(name) for name in collisions}
+    plan, skipped = resolve_conflicts(plan, existing, on_conflict, listing)
+    replace_existing = {'resume': _resume_one, 'newer': _replace_older}.get(on_conflict)
+    previous = read_manifest(output_dir) if name_key(MANIFEST_NAME) in listing else {}
+
+    record = {
+        'folder': output_dir,
+        'changes': [],
+        'timestamp': datetime.now(),
+        'deleted_originals': delete_originals,
+        'deleted_count': 0,
+        'moves': [],
+        'removed_sources': [],
+        'methods': {},
+        'bytes': 0,
+        'elapsed': 0.0,
+        'cancelled': False,
+        'errors': [],
+        'verified': 0,
+        'resumed': 0,
+        'skipped': len(skipped),
+        'files': [],
+    }
+    if log is not None:
+        record['job'] = log.job_id
+        log.begin(output_dir, plan, delete_originals, mode, existing,
+                  unchanged=len(carry) if carry is not None else None)
+
+    total = sum(1 for _, new_name in plan if new_name is not None)
+    link_duplicates = link_duplicates or {}
+    deferred = []
+    limiter = _DeviceLimiter(device_limit)
+    output_dev = os.stat(output_dir).st_dev
+    results = [None] * len(plan)
+    pending = {}
+    failure = None
+    done = 0
+    started = time.monotonic()
+    queued = iter(enumerate(plan))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        def fill():
+            # Keep a small window in flight instead of queueing the whole plan
+            while len(pending) < max(1, workers) * 2:
+                if cancel is not None and cancel.is_set():
+                    record['cancelled'] = True
+                    return
+                try:
+                    index, (old_path, new_name) = next(queued)
+                except StopIteration:
+                    return
+                if new_name is None:
+                    continue
+                new_path = os.path.join(output_dir, new_name)
+                if old_path in link_duplicates:
+                    deferred.append((index, old_path, new_path))
+                    continue
+                if name_key(new_name) in existing:
+                    future = pool.submit(replace_existing, old_path, new_path, previous,
+                                         delete_originals, limiter, output_dev, mode, verify)
+                else:
+                    future = pool.submit(_export_one, old_path, new_path,
+                                         delete_originals, limiter, output_dev, mode, verify)
+                pending[future] = (index, old_path, new_path)
+
+        fill()
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index, old_path, new_path = pending.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    failure = failure or e
+                    continue
+                nbytes = outcome[0]
+                results[index] = (old_path, new_path) + outcome
+                if log is not None and nbytes is not None:
+                    log.done(old_path, new_path, outcome[1], _removed_source(outcome, delete_originals))
+                done += 1
+                if progress:
+                    progress(done, total, new_path, nbytes or 0)
+            if failure is None:
+                fill()
+
+    # Duplicates last, once the copies they link to exist
+    if deferred and failure is None:
+        # Only targets that hold their source's data; one kept by 'newer'
+        # is some other file
+        exported = {r[0]: r[1] for r in results
+                    if r is not None and r[2] is not None and r[3] != 'skipped'}
+        for index, old_path, new_path in deferred:
+            if cancel is not None and cancel.is_set():
+                record['cancelled'] = True
+                break
+            target = exported.get(link_duplicates[old_path])
+            try:
+                if name_key(os.path.basename(new_path)) in existing:
+                    outcome = replace_existing(old_path, new_path, previous, delete_originals,
+                                               limiter, output_dev, mode, verify, target)
+                elif target is None:
+                    outcome = _export_one(old_path, new_path, delete_originals,
+                                          limiter, output_dev, mode, verify)
+                else:
+                    outcome = _link_duplicate(old_path, new_path, target, delete_originals,
+                                              limiter, output_dev, mode, verify)
+            except Exception as e:
+                failure = e
+                break
+            results[index] = (old_path, new_path) + outcome
+            if log is not None and outcome[0] is not None:
+                log.done(old_path, new_path, outcome[1], _removed_source(outcome, delete_originals))
+            done += 1
+            if progress:
+                progress(done, total, new_path, outcome[0] or 0)
+
+    # Assemble the record in plan order
+    for result in results:
+        if result is None or result[2] is None:
+            continue
+        old_path, new_path, nbytes, method, delete_error, checksums = result
+        if method == 'skipped':
+            record['skipped'] += 1
+            if delete_error is not None:
+                record['errors'].append((old_path, delete_error))
+            continue
+        if method == 'resumed':
+            record['resumed'] += 1
+        else:
+            record['changes'].append(new_path)
+            record['bytes'] += nbytes
+            record['methods'][method] = record['methods'].get(method, 0) + 1
+        if method == 'move':
+            record['moves'].append((old_path, new_path))
+        if delete_error is not None:
+            record['errors'].append((old_path, delete_error))
+        elif delete_originals:
+            record['deleted_count'] += 1
+            if method not in ('move', 'resumed'):
+                record['removed_sources'].append((old_path, new_path))
+        if checksums is not None:
+            status = 'verified' if checksums[0] == checksums[1] else 'mismatch'
+            record['verified'] += status == 'verified'
+        else:
+            status = {'move': 'moved', 'copy': 'copied', 'resumed': 'resumed'}.get(method, 'linked')
+        if method == 'resumed':
+            # Keep how the earlier run exported it, so a later resume or
+            # sync still recognises a duplicate link as current
+            entry = previous.get(new_path)
+            if entry and entry.get('source') == old_path:
+                method = entry.get('method')
+                if checksums is None and entry.get('source_checksum') is not None:
+                    checksums = (entry['source_checksum'], entry['copy_checksum'])
+                    status = entry.get('status', status)
+            else:
+                method = None
+        record['files'].append({
+            'source': old_path,
+            'target': new_path,
+            'size': nbytes,
+            'method': method,
+            'source_checksum': checksums and checksums[0],
+            'copy_checksum': checksums and checksums[1],
+            'status': status,
+        })
+    record['elapsed'] = time.monotonic() - started
+    if carry is None:
+        # Keep what earlier exports to this folder recorded about files
+        # this one left alone
+        written = {entry['target'] for entry in record['files']}
+        carry = [entry for target, entry in previous.items()
+                 if target not in written
+                 and name_key(os.path.basename(target or '')) in listing]
+    record['manifest'] = write_manifest(record, carry)
+    if log is not None:
+        log.end(record, failed=str(failure) if failure is not None else None)
+
+    if failure is not None:
+        failure.record = record
+        raise failure
+
+    return record
+
+
+class SyncPlan:
+    """What it takes to bring an earlier export up to date with a plan.
+
+    copy lists (source, name) for new and changed sources, unchanged the
+    (source, name) pairs already exported and current, stale the paths of
+    exported files whose source is no longer in the plan, and carry the
+    manifest entries to keep for the unchanged files.
+    """
+
+    def __init__(self, copy, unchanged, stale, carry):
+        self.copy = copy
+        self.unchanged = unchanged
+        self.stale = stale
+        self.carry = carry
+
+
+def plan_sync(plan, output_dir, base_name, format_type, workers=None):
+    """Compare plan with what an earlier export left in output_dir.
+
+    Files keep the names they were exported under, taken from the folder's
+    manifest, so adding images doesn't renumber (and recopy) everything
+    after them; new sources get the next free numbers in plan order. A
+    folder without a manifest (a plain export) is matched by the plan's own
+    names. A source counts as unchanged while its exported file is a
+    finished copy of it (see is_finished_copy), or a current link if it was
+    exported as a duplicate link (see is_linked_duplicate), so the
+    comparison costs a stat per file and no reads. Returns a SyncPlan.
+    """
+    listing = output_names(output_dir)
+    previous = read_manifest(output_dir)
+    entries = [(source, name) for source, name in plan if name is not None]
+    planned = {source for source, _ in entries}
+
+    known = {}  # source -> (name, manifest entry or None)
+    stale = []
+    for target, entry in previous.items():
+        name = os.path.basename(target or '')
+        if name_key(name) not in listing or not entry.get('source'):
+            continue
+        if entry['source'] in planned and entry['source'] not in known:
+            known[entry['source']] = (name, entry)
+        else:
+            stale.append(os.path.join(output_dir, name))
+    if not previous:
+        known = {source: (name, None) for source, name in entries if name_key(name) in listing}
+
+    def compare(batch):
+        results = []
+        for source, (name, entry) in batch:
+            src = metadata.read_stat(source)
+            dst = metadata.read_stat(os.path.join(output_dir, name))
+            if src is None or dst is None:
+                current = False
+            elif entry and entry.get('method') == 'duplicate-link':
+                current = is_linked_duplicate(src, dst)
+            else:
+                current = is_finished_copy(src, dst)
+            results.append((src, current))
+        return results
+
+    checked = dict(zip(known, metadata.map_batches(compare, list(known.items()), workers)))
+
+    # New names skip every number already used, whatever its extension
+    taken = {os.path.splitext(name)[0] for name in listing}
+    number = 0
+    copy, unchanged, carry = [], [], []
+    for source, name in entries:
+        if source in known:
+            name, entry = known[source]
+            src, current = checked[source]
+            if not current:
+                copy.append((source, name))
+                continue
+            unchanged.append((source, name))
+            target = os.path.join(output_dir, name)
+            carry.append(entry or {'source': source, 'target': target, 'size': src.st_size,
+                                   'method': None, 'source_checksum': None,
+                                   'copy_checksum': None, 'status': 'copied'})
+            continue
+        ext = os.path.splitext(name)[1]
+        while True:
+            number += 1
+            name = format_name(base_name, number, ext, format_type)
+            if name_key(os.path.splitext(name)[0]) not in taken:
+                break
+        taken.add(name_key(os.path.splitext(name)[0]))
+        copy.append((source, name))
+    return SyncPlan(copy, unchanged, stale, carry)
+
+
+def sync_export(sync, output_dir, prune=False, **options):
+    """Export only sync.copy (see plan_sync); options go to execute_plan.
+
+    Changed files are replaced in place. With prune, stale files are
+    deleted once the export has finished without being cancelled; that part
+    cannot be undone. The record also has ``unchanged`` and ``pruned``
+    counts, and the manifest covers every current file.
+    """
+    record = execute_plan(sync.copy, output_dir, on_conflict='resume', carry=sync.carry, **options)
+    record['unchanged'] = len(sync.unchanged)
+    record['pruned'] = 0
+    if prune and not record['cancelled']:
+        for path in sync.stale:
+            try:
+                os.remove(path)
+                record['pruned'] += 1
+            except FileNotFoundError:
+                pass
+    return record
+
+
+def _move_back(target, source):
+    """Return an exported file to where its original was"""
+    if os.path.lexists(source):
+        if not os.path.lexists(target):
+            # Moved back by an earlier undo that was cut short
+            raise FileNotFoundError(errno.ENOENT, "already moved back", target)
+        raise FileExistsError(errno.EEXIST, "original location is in use again", source)
+    os.makedirs(os.path.dirname(source), exist_ok=True)
+    try:
+        os.rename(target, source)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Original was on another device: copy back, then drop the export
+        fastcopy.copy2(target, source)
+        os.remove(target)
+
+
+def _undo_batch(batch, cancel=None):
+    """Undo one batch of (target, original or None); returns (target, outcome) pairs.
+
+    outcome is 'removed', 'restored', 'gone' (nothing left to undo) or an
+    error message. Stops early, with fewer pairs, once cancel is set.
+    """
+    outcomes = []
+    for target, source in batch:
+        if cancel is not None and cancel.is_set():
+            break
+        try:
+            if source is None:
+                os.remove(target)
+                outcomes.append((target, 'removed'))
+            else:
+                _move_back(target, source)
+                outcomes.append((target, 'restored'))
+        except FileNotFoundError:
+            outcomes.append((target, 'gone'))
+        except OSError as e:
+            outcomes.append((target, str(e)))
+    return outcomes
+
+
+def undo_export(record, progress=None, cancel=None, workers=DEFAULT_WORKERS, undone=None):
+    """Undo an export; returns a summary dict.
+
+    Exported copies are deleted and files whose original is gone (moved in
+    place or deleted after copying) are moved back to the original path.
+    Files are handled on ``workers`` threads in batches of at most
+    UNDO_BATCH, sized so every worker gets several, with no existence
+    check first: a file that is already gone just counts as undone.
+    progress, if given, is called as progress(done, total) from the calling
+    thread after each batch; cancel may be a threading.Event that stops the
+    undo after the files in progress. undone, if given, is called the same
+    way with the list of targets each batch undid, e.g. to journal them
+    (see journal.Journal.mark_reverted) so an undo cut short by a crash
+    picks up where it stopped.
+
+    The summary has ``removed`` and ``restored`` counts, ``errors`` as
+    (target, message) pairs and ``cancelled``. Whatever was not undone
+    stays in the record, so undo_export can simply be called again. Once
+    nothing is left, manifest entries for files that are gone and the empty
+    output folder are removed.
+    """
+    originals = {target: source
+                 for source, target in record['moves'] + record.get('removed_sources', [])}
+    tasks = [(target, originals.get(target)) for target in record['changes']]
+    size = -(-len(tasks) // (max(1, workers) * UNDO_TASKS_PER_WORKER))
+    size = min(UNDO_BATCH, max(1, size))
+    batches = [tasks[i:i + size] for i in range(0, len(tasks), size)]
+    summary = {'removed': 0, 'restored': 0, 'errors': [], 'cancelled': False}
+    finished_targets = set()
+    done = 0
+    queued = iter(batches)
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        def fill():
+            while len(pending) < max(1, workers) * 2:
+                if cancel is not None and cancel.is_set():
+                    summary['cancelled'] = True
+                    return
+                batch = next(queued, None)
+                if batch is None:
+                    return
+                pending.add(pool.submit(_undo_batch, batch, cancel))
+
+        fill()
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                pending.discard(future)
+                outcomes = future.result()
+                batch_undone = []
+                for target, outcome in outcomes:
+                    if outcome in ('removed', 'restored', 'gone'):
+                        batch_undone.append(target)
+                        if outcome != 'gone':
+                            summary[outcome] += 1
+                    else:
+                        summary['errors'].append((target, outcome))
+                finished_targets.update(batch_undone)
+                if undone and batch_undone:
+                    undone(batch_undone)
+                done += len(outcomes)
+                if progress:
+                    progress(done, len(tasks))
+            fill()
+    if cancel is not None and cancel.is_set() and done < len(tasks):
+        summary['cancelled'] = True
+
+    record['changes'] = [target for target in record['changes'] if target not in finished_targets]
+    record['moves'] = [pair for pair in record['moves'] if pair[1] not in finished_targets]
+    if 'removed_sources' in record:
+        record['removed_sources'] = [pair for pair in record['removed_sources']
+                                     if pair[1] not in finished_targets]
+    if record['changes']:
+        return summary
+
+    # The manifest may also list files other runs exported there
+    manifest = record.get('manifest')
+    if manifest:
+        _prune_manifest(manifest)
+
+    # Remove empty output folder
+    folder = record['folder']
+    with contextlib.suppress(OSError):
+        if not os.listdir(folder):
+            os.rmdir(folder)
+
+    return summary
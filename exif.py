@@ -0,0 +1,259 @@
+"""Header-only EXIF/TIFF reader.
+
+Reads TIFF structures (the container used by EXIF blocks in JPEGs, by
+TIFF files and by most RAW formats) straight from the file with a few
+small seeks and reads. Nothing is decoded, so it is cheap enough to run
+over whole libraries and works on formats Pillow cannot open.
+"""
+import struct
+from datetime import datetime
+
+# Byte size of each TIFF field type
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+
+# struct codes for the numeric field types
+TYPE_CODES = {1: 'B', 3: 'H', 4: 'L', 6: 'b', 8: 'h', 9: 'l', 11: 'f', 12: 'd', 13: 'L'}
+
+# Tags used by PhotoBatch
+TAG_COMPRESSION = 0x0103
+TAG_PHOTOMETRIC = 0x0106
+TAG_STRIP_OFFSETS = 0x0111
+TAG_ORIENTATION = 0x0112
+TAG_STRIP_BYTE_COUNTS = 0x0117
+TAG_DATETIME = 0x0132
+TAG_SUB_IFDS = 0x014A
+TAG_JPEG_OFFSET = 0x0201
+TAG_JPEG_LENGTH = 0x0202
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_SUBSEC_TIME_ORIGINAL = 0x9291
+
+# EXIF date/time layout ("2024:05:17 14:03:59")
+DATETIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+# Photometric values of sensor data (not a viewable preview)
+RAW_PHOTOMETRIC = (32803, 34892)
+
+# Sanity limits against corrupt or hostile files
+MAX_ENTRIES = 1000
+MAX_VALUE_BYTES = 1024 * 1024
+MAX_IFDS = 32
+MAX_JPEG_SEGMENTS = 64
+
+
+class TiffReader:
+    """Reads IFDs from a TIFF structure starting at ``base`` in file f"""
+
+    def __init__(self, f, base=0):
+        self.f = f
+        self.base = base
+        head = self.read_at(0, 8)
+        if head[:2] == b'II':
+            self.endian = '<'
+        elif head[:2] == b'MM':
+            self.endian = '>'
+        else:
+            raise ValueError("not a TIFF header")
+        self.first_ifd = struct.unpack(self.endian + 'L', head[4:8])[0]
+
+    def read_at(self, offset, size):
+        self.f.seek(self.base + offset)
+        data = self.f.read(size)
+        if len(data) < size:
+            raise ValueError("truncated TIFF structure")
+        return data
+
+    def ifd(self, offset):
+        """(entries, next_offset); entries maps tag -> (type, count, raw 4 bytes)"""
+        count = struct.unpack(self.endian + 'H', self.read_at(offset, 2))[0]
+        if count > MAX_ENTRIES:
+            raise ValueError("implausible IFD size")
+        data = self.read_at(offset + 2, count * 12 + 4)
+        entries = {}
+        for i in range(count):
+            tag, typ, n = struct.unpack(self.endian + 'HHL', data[i * 12:i * 12 + 8])
+            entries[tag] = (typ, n, data[i * 12 + 8:i * 12 + 12])
+        next_offset = struct.unpack(self.endian + 'L', data[count * 12:count * 12 + 4])[0]
+        return entries, next_offset
+
+    def value(self, entry):
+        """Decode an IFD entry: str, number, list of numbers or raw bytes"""
+        typ, n, raw = entry
+        size = TYPE_SIZES.get(typ, 1) * n
+        if size > MAX_VALUE_BYTES:
+            raise ValueError("IFD value too large")
+        if size <= 4:
+            data = raw[:size]
+        else:
+            data = self.read_at(struct.unpack(self.endian + 'L', raw)[0], size)
+
+        if typ == 2:
+            return data.split(b'\x00', 1)[0].decode('ascii', 'replace').strip()
+        if typ in (5, 10):
+            code = 'L' if typ == 5 else 'l'
+            nums = struct.unpack(f"{self.endian}{2 * n}{code}", data)
+            values = [a / b if b else 0.0 for a, b in zip(nums[::2], nums[1::2])]
+            return values[0] if n == 1 else values
+        if typ in TYPE_CODES:
+            values = struct.unpack(f"{self.endian}{n}{TYPE_CODES[typ]}", data)
+            return values[0] if n == 1 else list(values)
+        return data
+
+    def get(self, entries, tag, default=None):
+        """Value of tag in entries, or default if missing or unreadable"""
+        entry = entries.get(tag)
+        if entry is None:
+            return default
+        try:
+            return self.value(entry)
+        except (ValueError, struct.error):
+            return default
+
+    def iter_ifds(self):
+        """Yield every reachable IFD: the main chain, SubIFDs and the Exif IFD"""
+        pending = [self.first_ifd]
+        seen = set()
+        while pending and len(seen) < MAX_IFDS:
+            offset = pending.pop(0)
+            if not offset or offset in seen:
+                continue
+            seen.add(offset)
+            try:
+                entries, next_offset = self.ifd(offset)
+            except (ValueError, struct.error):
+                continue
+            yield entries
+            pending.append(next_offset)
+            for tag in (TAG_SUB_IFDS, TAG_EXIF_IFD):
+                children = self.get(entries, tag)
+                if isinstance(children, int):
+                    pending.append(children)
+                elif isinstance(children, list):
+                    pending.extend(children)
+
+
+def find_exif(f):
+    """Offset of the TIFF structure holding the file's EXIF data, or None.
+
+    TIFF-based files (TIFF, most RAWs) start with it; for JPEGs the marker
+    segments are walked up to the APP1 'Exif' block without touching the
+    image data.
+    """
+    f.seek(0)
+    head = f.read(4)
+    if head[:2] in (b'II', b'MM'):
+        return 0
+    if head[:2] != b'\xff\xd8':
+        return None
+
+    pos = 2
+    for _ in range(MAX_JPEG_SEGMENTS):
+        f.seek(pos)
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return None
+        kind = marker[1]
+        if kind == 0xDA or kind == 0xD9:
+            # Start of scan / end of image: no EXIF before the pixels
+            return None
+        length = struct.unpack('>H', marker[2:4])[0]
+        if kind == 0xE1 and f.read(6) == b'Exif\x00\x00':
+            return pos + 10
+        pos += 2 + length
+    return None
+
+
+def open_exif(f):
+    """TiffReader for the file's EXIF data, or None"""
+    try:
+        base = find_exif(f)
+        if base is None:
+            return None
+        return TiffReader(f, base)
+    except (ValueError, struct.error, OSError):
+        return None
+
+
+def embedded_jpegs(f):
+    """(offset, length) of every embedded JPEG preview, as absolute file offsets.
+
+    Covers EXIF thumbnails (IFD1 of a JPEG) and the preview images that
+    TIFF-based RAW files (CR2, NEF, ARW, DNG, ...) store next to the sensor
+    data.
+    """
+    reader = open_exif(f)
+    if reader is None:
+        return []
+
+    found = []
+    for entries in reader.iter_ifds():
+        offset = reader.get(entries, TAG_JPEG_OFFSET)
+        length = reader.get(entries, TAG_JPEG_LENGTH)
+        if isinstance(offset, int) and isinstance(length, int) and length > 0:
+            found.append((reader.base + offset, length))
+            continue
+
+        # Single-strip JPEG-compressed images that are not sensor data
+        compression = reader.get(entries, TAG_COMPRESSION)
+        photometric = reader.get(entries, TAG_PHOTOMETRIC)
+        strips = reader.get(entries, TAG_STRIP_OFFSETS)
+        counts = reader.get(entries, TAG_STRIP_BYTE_COUNTS)
+        if (compression in (6, 7) and photometric not in RAW_PHOTOMETRIC
+                and isinstance(strips, int) and isinstance(counts, int) and counts > 0):
+            found.append((reader.base + strips, counts))
+    return found
+
+
+def orientation(f):
+    """EXIF orientation (1-8) of the file, 1 if unknown"""
+    reader = open_exif(f)
+    if reader is None:
+        return 1
+    try:
+        entries, _ = reader.ifd(reader.first_ifd)
+    except (ValueError, struct.error):
+        return 1
+    value = reader.get(entries, TAG_ORIENTATION, 1)
+    return value if isinstance(value, int) and 1 <= value <= 8 else 1
+
+
+def parse_datetime(text, subsec=None):
+    """datetime from an EXIF date/time string, or None if blank or malformed"""
+    if not isinstance(text, str) or len(text) < 19:
+        return None
+    try:
+        value = datetime.strptime(text[:19], DATETIME_FORMAT)
+    except ValueError:
+        # Cameras with an unset clock write "0000:00:00 00:00:00" or spaces
+        return None
+    if isinstance(subsec, str) and subsec.strip().isdigit():
+        digits = subsec.strip()[:6].ljust(6, '0')
+        value = value.replace(microsecond=int(digits))
+    return value
+
+
+def capture_time(f):
+    """When the photo was taken (DateTimeOriginal), or None.
+
+    Reads IFD0 and the Exif IFD only; falls back to IFD0's DateTime, which
+    editors may have rewritten but is better than nothing.
+    """
+    reader = open_exif(f)
+    if reader is None:
+        return None
+    try:
+        ifd0, _ = reader.ifd(reader.first_ifd)
+    except (ValueError, struct.error):
+        return None
+
+    exif_offset = reader.get(ifd0, TAG_EXIF_IFD)
+    if isinstance(exif_offset, int) and exif_offset:
+        try:
+            entries, _ = reader.ifd(exif_offset)
+        except (ValueError, struct.error):
+            entries = {}
+        taken = parse_datetime(reader.get(entries, TAG_DATETIME_ORIGINAL),
+                               reader.get(entries, TAG_SUBSEC_TIME_ORIGINAL))
+        if taken is not None:
+            return taken
+    return parse_datetime(reader.get(ifd0, TAG_DATETIME))
@@ -0,0 +1,136 @@
+"""Image format detection by content.
+
+Files are classified from their first few bytes (magic numbers) rather than
+their extension, so mislabeled files are rejected and HEIC, RAW and
+extensionless images are picked up. Each thread reads headers into one
+reused buffer, and results are cached by (path, size, mtime) so a rescan of
+an unchanged library costs one stat per file.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Bytes needed to tell every supported format apart
+HEADER_SIZE = 32
+
+# Formats that count as images, with a display name
+IMAGE_FORMATS = {
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+    'gif': 'GIF',
+    'bmp': 'BMP',
+    'webp': 'WEBP',
+    'tiff': 'TIFF',
+    'heif': 'HEIC/HEIF',
+    'avif': 'AVIF',
+    'jxl': 'JPEG XL',
+    'raw': 'RAW',
+}
+
+# TIFF-based RAW files share the TIFF magic; the extension tells them apart
+RAW_EXTENSIONS = ('.arw', '.cr2', '.dng', '.nef', '.nrw', '.pef', '.sr2', '.srw',
+                  '.erf', '.kdc', '.mos', '.mef', '.3fr', '.iiq', '.rwl')
+
+# ISO-BMFF brands (bytes 8-12 after 'ftyp')
+HEIF_BRANDS = (b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1')
+AVIF_BRANDS = (b'avif', b'avis')
+
+# Entries kept before the cache is dropped and rebuilt
+CACHE_LIMIT = 500000
+
+_cache = {}
+_local = threading.local()
+
+
+def sniff(header, ext=''):
+    """Format name for a file header, or None if it is not a known image"""
+    if header[:3] == b'\xff\xd8\xff':
+        return 'jpeg'
+    if header[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    if header[:4] in (b'II*\x00', b'MM\x00*'):
+        if header[8:10] == b'CR' or ext in RAW_EXTENSIONS:
+            return 'raw'
+        return 'tiff'
+    if header[:4] in (b'IIRO', b'IIRS', b'IIU\x00', b'MMOR'):
+        # Olympus ORF, Panasonic RW2
+        return 'raw'
+    if header[:15] == b'FUJIFILMCCD-RAW':
+        return 'raw'
+    if header[4:8] == b'ftyp':
+        brand = header[8:12]
+        if brand == b'crx ':
+            return 'raw'
+        if brand in HEIF_BRANDS:
+            return 'heif'
+        if brand in AVIF_BRANDS:
+            return 'avif'
+    if header[:2] == b'\xff\x0a' or header[:12] == b'\x00\x00\x00\x0cJXL \r\n\x87\n':
+        return 'jxl'
+    if header[:2] == b'BM' and len(header) >= 14:
+        return 'bmp'
+    return None
+
+
+def _header_buffer():
+    """Per-thread buffer for header reads"""
+    buf = getattr(_local, 'buf', None)
+    if buf is None:
+        buf = _local.buf = bytearray(HEADER_SIZE)
+    return buf
+
+
+def detect_format(path, st=None):
+    """Format of the file at path (see IMAGE_FORMATS) or None.
+
+    st may be a stat result the caller already has; results are cached by
+    (size, mtime) so unchanged files are never reopened.
+    """
+    try:
+        if st is None:
+            st = os.stat(path)
+        key = (st.st_size, st.st_mtime_ns)
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        buf = _header_buffer()
+        with open(path, 'rb', buffering=0) as f:
+            n = f.readinto(buf)
+        fmt = sniff(bytes(buf[:n]), os.path.splitext(path)[1].lower())
+    except OSError:
+        return None
+
+    if len(_cache) >= CACHE_LIMIT:
+        _cache.clear()
+    _cache[path] = (key, fmt)
+    return fmt
+
+
+def is_image(path):
+    """True if the file's content is a known image format"""
+    return detect_format(path) is not None
+
+
+def filter_images(paths, workers=None):
+    """Image paths from paths, in their original order.
+
+    With workers, headers are read on a thread pool, which pays off on
+    network shares where each open is a round trip.
+    """
+    paths = list(paths)
+    if workers and workers > 1 and len(paths) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            flags = list(pool.map(is_image, paths))
+    else:
+        flags = [is_image(p) for p in paths]
+    return [p for p, keep in zip(paths, flags) if keep]
+
+
+def clear_cache():
+    """Forget all cached detections"""
+    _cache.clear()
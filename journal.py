@@ -0,0 +1,370 @@
+"""On-disk journal of export jobs.
+
+Every export gets an append-only JSON-lines file: a 'begin' entry, one
+'plan' entry per file written (and fsynced) before anything is touched,
+a 'done' entry as each file completes and an 'end' entry when the job
+finishes. Completions are fsynced in batches, so journaling costs a few
+syncs per thousand files rather than one per file.
+
+Because the plan is on disk before the first copy, a job that never
+reached 'end' (crash, power loss, killed process) can be inspected at
+the next start. A running job holds an exclusive lock on a '.lock' file
+next to its journal, so jobs still running in another process (a CLI
+export, a second window) are told apart from dead ones. Dead jobs are
+inspected: targets are checked against their sources and the job is
+either kept as far as it got or rolled back. Finished jobs can be turned
+back into undo records at any time, so undo survives restarts.
+"""
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except Exception:
+    FCNTL_AVAILABLE = False
+try:
+    import msvcrt
+    MSVCRT_AVAILABLE = True
+except Exception:
+    MSVCRT_AVAILABLE = False
+
+import engine
+
+# Completions buffered before an fsync, and the longest a completion may
+# sit unsynced
+FSYNC_EVERY = 256
+FSYNC_INTERVAL = 1.0
+
+# Finished jobs kept; older journals are deleted when a new job starts
+MAX_JOBS = 100
+
+JOURNAL_SUFFIX = '.jsonl'
+LOCK_SUFFIX = '.lock'
+
+
+def default_journal_dir():
+    """Per-user data folder for job journals"""
+    if sys.platform == 'win32':
+        base = os.environ.get('APPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Application Support')
+    else:
+        base = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return os.path.join(base, 'PhotoBatch', 'jobs')
+
+
+def _try_lock(f):
+    """Lock open binary file f exclusively without waiting; False if it is held elsewhere.
+
+    The lock goes away with the process, however it ends. Without fcntl or
+    msvcrt nothing is locked and True is returned.
+    """
+    try:
+        if FCNTL_AVAILABLE:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif MSVCRT_AVAILABLE:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def is_running(job_path):
+    """Whether the job journaled at job_path is still held by a live process"""
+    lock_path = job_path[:-len(JOURNAL_SUFFIX)] + LOCK_SUFFIX
+    try:
+        with open(lock_path, 'r+b') as f:
+            return not _try_lock(f)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        # Can't tell; treat it as live rather than touch its files
+        return True
+
+
+class JobLog:
+    """Writer for one job's journal; used by engine.execute_plan.
+
+    All methods are called from a single thread. The file is only created
+    by begin, so a job refused before it starts leaves nothing behind.
+    """
+
+    def __init__(self, path, job_id):
+        self.path = path
+        self.job_id = job_id
+        self.file = None
+        self.lock = None
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def write(self, entry):
+        self.file.write(json.dumps(entry) + '\n')
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def begin(self, output_dir, plan, delete_originals, mode, existing=(), unchanged=None):
+        """Record the job and its whole plan, durably, before any file is touched.
+
+        existing holds the name_key of planned names that were already in
+        output_dir (see engine.output_names); their plan entries are marked
+        so recovery never removes a file this job did not create. unchanged
+        is the number of files a sync left as they were, None for a plain
+        export.
+        """
+        self.lock = open(self.path[:-len(JOURNAL_SUFFIX)] + LOCK_SUFFIX, 'wb')
+        _try_lock(self.lock)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        entry = {'op': 'begin', 'job': self.job_id, 'time': datetime.now().isoformat(),
+                 'folder': output_dir, 'delete_originals': delete_originals, 'mode': mode}
+        if unchanged is not None:
+            entry['unchanged'] = unchanged
+        self.write(entry)
+        for source, new_name in plan:
+            if new_name is not None:
+                entry = {'op': 'plan', 'source': source, 'target': os.path.join(output_dir, new_name)}
+                if engine.name_key(new_name) in existing:
+                    entry['existed'] = True
+                self.write(entry)
+        self.sync()
+
+    def done(self, source, target, method, deleted):
+        """Record a completed file; synced in batches"""
+        self.write({'op': 'done', 'source': source, 'target': target,
+                    'method': method, 'deleted': deleted})
+        self.unsynced += 1
+        if self.unsynced >= FSYNC_EVERY or time.monotonic() - self.last_sync >= FSYNC_INTERVAL:
+            self.sync()
+
+    def end(self, record, failed=None):
+        """Record the job's outcome and close the journal"""
+        self.write({'op': 'end', 'cancelled': record['cancelled'], 'failed': failed,
+                    'manifest': record.get('manifest')})
+        self.sync()
+        self.file.close()
+        self.lock.close()
+        try:
+            os.remove(self.lock.name)
+        except OSError:
+            pass
+
+
+class Job:
+    """A job replayed from its journal"""
+
+    def __init__(self, path):
+        self.path = path
+        self.job_id = os.path.basename(path)[:-len(JOURNAL_SUFFIX)]
+        self.info = {}
+        self.planned = []  # [(source, target)]
+        self.existed = set()  # targets that were there before the job
+        self.completed = {}  # target -> (source, method, deleted)
+        self.ended = None
+        self.undone = False
+        self.reverted = set()  # targets an unfinished undo already dealt with
+        self.recovered = None
+
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-write
+                    continue
+                op = entry.get('op')
+                if op == 'begin':
+                    self.info = entry
+                elif op == 'plan':
+                    self.planned.append((entry['source'], entry['target']))
+                    if entry.get('existed'):
+                        self.existed.add(entry['target'])
+                elif op == 'done':
+                    self.completed[entry['target']] = (entry['source'], entry['method'], entry['deleted'])
+                elif op == 'end':
+                    self.ended = entry
+                elif op == 'undone':
+                    self.undone = True
+                elif op == 'reverted':
+                    self.reverted.update(entry['targets'])
+                elif op == 'recovered':
+                    self.recovered = entry
+
+    @property
+    def folder(self):
+        return self.info.get('folder')
+
+    @property
+    def timestamp(self):
+        try:
+            return datetime.fromisoformat(self.info['time'])
+        except (KeyError, ValueError):
+            return datetime.fromtimestamp(os.path.getmtime(self.path))
+
+    @property
+    def state(self):
+        """'undone', 'interrupted', 'rolled back' or 'complete'"""
+        if self.undone:
+            return 'undone'
+        if self.recovered is not None:
+            return 'rolled back' if self.recovered.get('rolled_back') else 'complete'
+        if self.ended is None:
+            return 'interrupted'
+        return 'complete'
+
+    def record(self):
+        """Undo record (see engine.execute_plan) for what this job exported"""
+        changes = []
+        moves = []
+        removed_sources = []
+        deleted = 0
+        methods = {}
+        for source, target in self.planned:
+            done = self.completed.get(target)
+            if done is None or target in self.reverted:
+                continue
+            _, method, was_deleted = done
+            if method in ('resumed', 'skipped'):
+                # Left over from an earlier job; not this job's to undo
+                continue
+            changes.append(target)
+            methods[method] = methods.get(method, 0) + 1
+            if method == 'move':
+                moves.append((source, target))
+            elif was_deleted:
+                removed_sources.append((source, target))
+            deleted += was_deleted
+        record = {
+            'folder': self.folder,
+            'changes': changes,
+            'timestamp': self.timestamp,
+            'deleted_originals': bool(self.info.get('delete_originals')),
+            'deleted_count': deleted,
+            'moves': moves,
+            'removed_sources': removed_sources,
+            'methods': methods,
+            'bytes': 0,
+            'elapsed': 0.0,
+            'cancelled': bool(self.ended and self.ended.get('cancelled')),
+            'errors': [],
+            'verified': 0,
+            'manifest': (self.ended or {}).get('manifest'),
+            'job': self.job_id,
+        }
+        if 'unchanged' in self.info:
+            # A sync: its manifest also covers files it didn't export
+            record['unchanged'] = self.info['unchanged']
+        return record
+
+
+class Journal:
+    """Folder of job journals"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or default_journal_dir()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def start(self):
+        """New JobLog for a job about to run"""
+        self.prune()
+        # Sortable by start time, microseconds included so ids order correctly
+        job_id = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:4]}"
+        return JobLog(os.path.join(self.directory, job_id + JOURNAL_SUFFIX), job_id)
+
+    def paths(self):
+        try:
+            names = sorted(os.listdir(self.directory))
+        except OSError:
+            return []
+        return [os.path.join(self.directory, n) for n in names if n.endswith(JOURNAL_SUFFIX)]
+
+    def jobs(self):
+        """Every journaled job, newest first"""
+        found = []
+        for path in reversed(self.paths()):
+            try:
+                found.append(Job(path))
+            except OSError:
+                continue
+        return found
+
+    def job(self, job_id):
+        return Job(os.path.join(self.directory, job_id + JOURNAL_SUFFIX))
+
+    def append(self, job_id, entry):
+        """Add an entry to a finished job's journal"""
+        with open(os.path.join(self.directory, job_id + JOURNAL_SUFFIX), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def mark_undone(self, job_id):
+        self.append(job_id, {'op': 'undone', 'time': datetime.now().isoformat()})
+
+    def mark_reverted(self, job_id, targets):
+        """Record targets a running undo has dealt with; record() leaves them out"""
+        self.append(job_id, {'op': 'reverted', 'targets': list(targets)})
+
+    def interrupted(self, jobs=None):
+        """Jobs that never finished and are not running any more, newest first.
+
+        jobs may be the result of an earlier jobs() call, so the journals
+        are not read twice.
+        """
+        if jobs is None:
+            jobs = self.jobs()
+        return [job for job in jobs
+                if job.state == 'interrupted' and job.info and not is_running(job.path)]
+
+    def settle(self, job):
+        """Sort out the targets of an interrupted job that were never marked done.
+
+        Each is checked on disk: if the source is gone the file was moved or
+        deleted after a full copy, so it counts as done; if the source is
+        still there the target may be a partial copy and is removed.
+        Targets that were already there when the job started (kept by
+        'newer', or finished by an earlier run when resuming) are left
+        alone. Returns the 'completed' and 'removed' counts; job.record()
+        then covers everything the job exported, so rolling the job back is
+        an ordinary engine.undo_export of that record.
+        """
+        counts = {'completed': 0, 'removed': 0}
+        for source, target in job.planned:
+            if target in job.completed or target in job.existed or not os.path.exists(target):
+                continue
+            if os.path.exists(source):
+                os.remove(target)
+                counts['removed'] += 1
+            else:
+                job.completed[target] = (source, 'recovered', True)
+                self.append(job.job_id, {'op': 'done', 'source': source, 'target': target,
+                                         'method': 'recovered', 'deleted': True})
+                counts['completed'] += 1
+        return counts
+
+    def mark_recovered(self, job_id, rolled_back=False):
+        """Record that an interrupted job was settled; it is then no longer offered"""
+        self.append(job_id, {'op': 'recovered', 'rolled_back': rolled_back,
+                             'time': datetime.now().isoformat()})
+        try:
+            # Left by the dead process
+            os.remove(os.path.join(self.directory, job_id + LOCK_SUFFIX))
+        except OSError:
+            pass
+
+    def prune(self):
+        """Delete the oldest settled journals beyond MAX_JOBS"""
+        paths = self.paths()
+        for path in paths[:max(0, len(paths) - MAX_JOBS)]:
+            try:
+                if Job(path).state != 'interrupted':
+                    os.remove(path)
+            except OSError:
+                continue
@@ -0,0 +1,155 @@
+"""Optional SQLite index of scanned files.
+
+Remembers size, mtime, format, dimensions, EXIF capture time and content
+hash for every path that has been scanned. A rescan stats each file and
+only re-reads the ones whose size or mtime changed, so reopening a large
+library skips the header parsing for everything that is unchanged.
+
+sqlite3 ships with Python but is missing from some minimal builds; check
+SQLITE_AVAILABLE before creating a LibraryIndex.
+"""
+import os
+import threading
+from collections import namedtuple
+try:
+    import sqlite3
+    SQLITE_AVAILABLE = True
+except Exception:
+    SQLITE_AVAILABLE = False
+
+import formats
+import metadata
+from thumbnails import cache_root
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    format TEXT,
+    width INTEGER,
+    height INTEGER,
+    captured REAL,
+    hash TEXT
+)
+"""
+
+COLUMNS = 'path, size, mtime_ns, format, width, height, captured, hash'
+
+# Paths per SELECT ... IN (...) query; SQLite allows 999 parameters by default
+QUERY_CHUNK = 500
+
+# One indexed file; format is None for non-images, captured is a POSIX
+# timestamp of the EXIF capture time and hash is filled in on demand
+FileInfo = namedtuple('FileInfo', COLUMNS.replace(',', ''))
+
+
+def default_index_path():
+    """Per-user location of the library index"""
+    return os.path.join(cache_root(), 'library.sqlite3')
+
+
+def read_info(path, st):
+    """FileInfo for path from its header, given a fresh stat result"""
+    fmt = formats.detect_format(path, st)
+    width = height = taken = None
+    if fmt is not None:
+        size = metadata.dimensions(path)
+        if size is not None:
+            width, height = size
+        taken = metadata.capture_time(path, st)
+    return FileInfo(path, st.st_size, st.st_mtime_ns, fmt, width, height,
+                    taken.timestamp() if taken is not None else None, None)
+
+
+class LibraryIndex:
+    """SQLite-backed cache of per-file metadata, safe to use from threads"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_index_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        with self.write_lock, self.connection() as conn:
+            conn.execute(SCHEMA)
+
+    def connection(self):
+        """This thread's connection (sqlite3 connections can't be shared)"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            # WAL lets readers run while another thread commits
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def rows(self, paths):
+        """Stored FileInfo for each known path in paths, keyed by path"""
+        paths = list(paths)
+        conn = self.connection()
+        found = {}
+        for i in range(0, len(paths), QUERY_CHUNK):
+            chunk = paths[i:i + QUERY_CHUNK]
+            marks = ','.join('?' * len(chunk))
+            for row in conn.execute(f"SELECT {COLUMNS} FROM files WHERE path IN ({marks})", chunk):
+                found[row[0]] = FileInfo(*row)
+        return found
+
+    def lookup(self, paths, workers=None):
+        """FileInfo for each path (None if it can't be stat'ed), in order.
+
+        Every path is stat'ed; only new files and files whose size or mtime
+        changed are read again, in parallel batches, and written back in a
+        single transaction.
+        """
+        paths = list(paths)
+        stats = metadata.map_batches(
+            lambda batch: [metadata.read_stat(p) for p in batch], paths, workers)
+        known = self.rows(paths)
+
+        results = []
+        stale = []
+        for path, st in zip(paths, stats):
+            row = known.get(path)
+            if st is not None and row is not None and (row.size, row.mtime_ns) == (st.st_size, st.st_mtime_ns):
+                results.append(row)
+            else:
+                if st is not None:
+                    stale.append((len(results), path, st))
+                results.append(None)
+
+        if stale:
+            fresh = metadata.map_batches(
+                lambda batch: [read_info(path, st) for _, path, st in batch], stale, workers)
+            for (slot, _, _), info in zip(stale, fresh):
+                results[slot] = info
+            self.store(fresh)
+        return results
+
+    def store(self, infos):
+        """Insert or replace rows for infos"""
+        with self.write_lock, self.connection() as conn:
+            conn.executemany(f"INSERT OR REPLACE INTO files ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             [tuple(info) for info in infos])
+
+    def set_hashes(self, hashes):
+        """Record content hashes given as (path, size, mtime_ns, digest).
+
+        Rows whose size or mtime no longer match are left alone.
+        """
+        with self.write_lock, self.connection() as conn:
+            conn.executemany("UPDATE files SET hash = ? WHERE path = ? AND size = ? AND mtime_ns = ?",
+                             [(digest, path, size, mtime_ns) for path, size, mtime_ns, digest in hashes])
+
+    def forget(self, paths):
+        """Drop rows for paths, e.g. files that were deleted"""
+        with self.write_lock, self.connection() as conn:
+            conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in paths])
+
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
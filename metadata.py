@@ -0,0 +1,110 @@
+"""Per-file metadata used to order images.
+
+Capture times come from the EXIF header (see exif), read with a few small
+seeks instead of decoding the image. Lookups run in batches on a thread
+pool and are cached by (path, size, mtime), like format detection, so
+sorting the same library again only costs a stat per file.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+import exif
+
+# Paths handed to a worker per task; keeps pool overhead low on 100k files
+BATCH_SIZE = 256
+
+# Entries kept before the cache is dropped and rebuilt
+CACHE_LIMIT = 500000
+
+_cache = {}
+
+
+def read_stat(path):
+    """os.stat of path, or None if it can't be read"""
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def capture_time(path, st=None):
+    """EXIF capture time of the file at path as a datetime, or None.
+
+    st may be a stat result the caller already has.
+    """
+    try:
+        if st is None:
+            st = os.stat(path)
+        key = (st.st_size, st.st_mtime_ns)
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        with open(path, 'rb') as f:
+            taken = exif.capture_time(f)
+    except OSError:
+        return None
+
+    if len(_cache) >= CACHE_LIMIT:
+        _cache.clear()
+    _cache[path] = (key, taken)
+    return taken
+
+
+def dimensions(path):
+    """(width, height) of the image at path, or None.
+
+    Image.open only parses the header; pixels are never decoded. Formats
+    Pillow can't open (RAW) have no dimensions.
+    """
+    if not PIL_AVAILABLE:
+        return None
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def _read_batch(paths, want_time):
+    results = []
+    for path in paths:
+        st = read_stat(path)
+        taken = capture_time(path, st) if want_time and st is not None else None
+        results.append((st, taken))
+    return results
+
+
+def read_many(paths, capture_times=False, workers=None):
+    """(stat or None, capture time or None) for each path, in order.
+
+    Capture times are only read when capture_times is set. With workers,
+    batches of BATCH_SIZE paths run on a thread pool.
+    """
+    return map_batches(lambda batch: _read_batch(batch, capture_times), paths, workers)
+
+
+def map_batches(fn, items, workers=None):
+    """Concatenated fn(batch) over items split into BATCH_SIZE lists.
+
+    fn must return one result per item; with workers the batches run on a
+    thread pool. Results keep the order of items.
+    """
+    items = list(items)
+    batches = [items[i:i + BATCH_SIZE] for i in range(0, len(items), BATCH_SIZE)]
+    if workers and workers > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(fn, batches))
+    else:
+        chunks = [fn(batch) for batch in batches]
+    return [item for chunk in chunks for item in chunk]
+
+
+def clear_cache():
+    """Forget all cached capture times"""
+    _cache.clear()
@@ -1,4 +1,15 @@
 import os
+import queue
+import sys
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # Any arguments mean batch mode: run headless, before tkinter and the
+    # GUI-only modules are imported, so it also works on machines without them
+    import cli
+    sys.exit(cli.main())
+
+import threading
+import time
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 try:
@@ -8,14 +19,48 @@ except Exception:
     DND_AVAILABLE = False
     DND_FILES = None
     TkinterDnD = None
-import shutil
-from datetime import datetime
 try:
-    from PIL import Image, ImageTk
+    from PIL import ImageTk
     PIL_AVAILABLE = True
 except Exception:
     PIL_AVAILABLE = False
 
+import duplicates
+import engine
+import journal
+import library
+import similar
+from thumbnails import LRUCache, ThumbnailCache, ThumbnailPrefetcher
+from widgets import ThumbnailGrid, VirtualTreeview
+
+# Delay after the last keystroke before the preview is regenerated
+PREVIEW_DEBOUNCE_MS = 250
+
+# Removals up to this many rows delete list entries in place instead of
+# rebuilding files_to_rename
+REMOVE_IN_PLACE_LIMIT = 256
+
+# Folder scans hand files to the UI in batches of this size, and at most
+# this many batches are taken per poll
+SCAN_BATCH_SIZE = 2000
+SCAN_BATCHES_PER_POLL = 5
+
+# Threads used to read file headers when filtering a selection
+DETECT_WORKERS = 8
+
+# Box the preview window image is fitted into, and how many decoded
+# previews are kept in memory
+PREVIEW_BOX = (860, 580)
+PHOTO_CACHE_SIZE = 32
+
+# Thumbnail grid: cell image box, decoded thumbnails kept in memory, decode
+# threads, pages prefetched beyond the view and results handled per poll
+THUMB_BOX = (120, 90)
+THUMB_PHOTO_CACHE_SIZE = 600
+THUMB_WORKERS = 4
+PREFETCH_PAGES = 2
+THUMBS_PER_POLL = 40
+
 class ModernImageRenamer:
     def __init__(self, root):
         self.root = root
@@ -62,11 +107,67 @@ class ModernImageRenamer:
         
         # State management
         self.current_folder = None
-        self.selected_files = []
+        self.selected_files = {}  # ordered, keyed by path for O(1) removal
         self.files_to_rename = []
-        self.rename_history = []
+        self.rename_history = []  # undo records, oldest first
         self.preview_data = []
-        self.preview_item_paths = {}
+        self.preview_source = None  # files_to_rename list the preview was built from
+        self.preview_key = None  # (base name, format, duplicate mode) of the current preview
+        self.preview_after_id = None
+        
+        # Background export state
+        self.export_thread = None
+        self.export_cancel = None
+        self.export_queue = None
+        self.export_job = None
+        self.undo_queue = None  # background undo, shares the export's thread and cancel slots
+        
+        # Preview caches: decoded thumbnails on disk, PhotoImages in memory
+        self.thumbnail_cache = ThumbnailCache() if PIL_AVAILABLE else None
+        self.photo_cache = LRUCache(PHOTO_CACHE_SIZE)
+        self.thumbnail_photos = LRUCache(THUMB_PHOTO_CACHE_SIZE)
+        self.thumbnail_failed = set()
+        self.thumbnail_prefetcher = (
+            ThumbnailPrefetcher(self.thumbnail_cache, THUMB_BOX, workers=THUMB_WORKERS)
+            if PIL_AVAILABLE else None
+        )
+        
+        # Optional metadata index of scanned files, so rescans skip unchanged
+        # ones; opened when "Remember scanned files" is checked
+        self.library_index = None
+        
+        # On-disk journal of export jobs; undo history survives restarts
+        self.journal = None
+        try:
+            self.journal = journal.Journal()
+        except OSError:
+            # Read-only home: exports still work, undo is per session
+            self.journal = None
+        self.pending_rollbacks = []  # recovered jobs waiting for their undo
+        
+        # Exact duplicates in files_to_rename, found in the background
+        self.duplicates = {}  # duplicate path -> path of the first copy
+        self.duplicates_source = None  # files_to_rename list they were found in
+        self.duplicate_queue = None
+        
+        # Near-duplicate clusters of files_to_rename
+        self.similar_groups = {}  # path -> cluster number
+        self.similar_source = None  # files_to_rename list they were found in
+        self.similar_queue = None
+        
+        # Names already in the preview's output folder, from one directory scan
+        self.existing_names = set()
+        self.existing_dir = None  # output folder they were listed from
+        self.collision_queue = None
+        
+        # Background sort and selection check state
+        self.sort_queue = None
+        self.selection_queue = None
+        
+        # Background folder scan state
+        self.scan_thread = None
+        self.scan_queue = None
+        self.scan_cancel = None
         
         # Export settings
         self.custom_export_dir = None  # None means use default (script directory)
@@ -82,10 +183,16 @@ class ModernImageRenamer:
         
         # Keyboard shortcuts
         self.root.bind('<Control-o>', lambda e: self.browse_files())
+        self.root.bind('<Control-O>', lambda e: self.browse_folder())
         self.root.bind('<Control-r>', lambda e: self.preview_rename())
         self.root.bind('<Control-z>', lambda e: self.undo_last_rename())
         self.root.bind('<F1>', lambda e: self.show_help())
         
+        if PIL_AVAILABLE:
+            self.root.after(150, self.poll_thumbnails)
+        if self.journal is not None:
+            self.load_history()
+        
     def setup_styles(self):
         """Configure ttk styles - Modern Neo-Retro look"""
         style = ttk.Style()
@@ -152,6 +259,12 @@ class ModernImageRenamer:
                        relief='raised',
                        padding=(8, 4))
         
+        # Configure export progress bar
+        style.configure('Modern.Horizontal.TProgressbar',
+                       background=self.colors['primary'],
+                       troughcolor=self.colors['bg_card'],
+                       borderwidth=1)
+        
         style.map('Modern.Treeview',
                  background=[('selected', self.colors['selection'])],
                  foreground=[('selected', self.colors['text_primary'])])
@@ -227,7 +340,7 @@ class ModernImageRenamer:
                                    highlightcolor=self.colors['primary'],
                                    highlightbackground=self.colors['border'])
         self.path_entry.pack(fill='x', pady=(0, 10), ipady=6)
-        self.path_entry.insert(0, "No images selected... (Click Browse or drag files here)")
+        self.path_entry.insert(0, "No images selected... (Click Browse or drag files or folders here)")
         self.path_entry.config(state='readonly')
         
         # Buttons row
@@ -240,6 +353,12 @@ class ModernImageRenamer:
                                style='Primary.TButton')
         browse_btn.pack(side='left', padx=(0, 6))
         
+        folder_btn = ttk.Button(btn_frame,
+                               text="Select Folder...",
+                               command=self.browse_folder,
+                               style='Secondary.TButton')
+        folder_btn.pack(side='left', padx=(0, 6))
+        
         self.clear_btn = ttk.Button(btn_frame,
                                text="Clear All",
                                command=self.clear_selection,
@@ -254,6 +373,36 @@ class ModernImageRenamer:
                                         bg=self.colors['bg_card'],
                                         fg=self.colors['text_secondary'])
         self.file_count_label.pack(side='left', padx=8)
+        
+        # Keep scanned files' metadata in the library index
+        self.index_var = tk.BooleanVar(value=False)
+        
+        index_cb = tk.Checkbutton(btn_frame,
+                                  text="Remember scanned files",
+                                  variable=self.index_var,
+                                  command=self.toggle_library_index,
+                                  font=('Segoe UI', 9),
+                                  bg=self.colors['bg_card'],
+                                  fg=self.colors['text_primary'],
+                                  selectcolor='white',
+                                  activebackground=self.colors['bg_card'],
+                                  highlightthickness=0,
+                                  state='normal' if library.SQLITE_AVAILABLE else 'disabled')
+        index_cb.pack(side='right')
+    
+    def toggle_library_index(self):
+        """Open or drop the library index when its checkbox changes"""
+        if not self.index_var.get():
+            # Running scans keep the index they started with
+            self.library_index = None
+            return
+        try:
+            self.library_index = library.LibraryIndex()
+        except Exception as e:
+            # Read-only home or locked database: scan without the index
+            self.library_index = None
+            self.index_var.set(False)
+            self.update_status(f"Library index unavailable: {e}", 'error')
     
     def create_naming_card(self, parent):
         """Create naming configuration section - modern neo-retro style"""
@@ -285,7 +434,7 @@ class ModernImageRenamer:
                                    highlightbackground=self.colors['border'])
         self.name_entry.pack(side='left', fill='x', expand=True, ipady=6)
         self.name_entry.insert(0, "V-2025-U-0772")
-        self.name_entry.bind('<KeyRelease>', lambda e: self.auto_preview())
+        self.name_entry.bind('<KeyRelease>', lambda e: self.schedule_preview())
         
         # Format options row
         format_frame = tk.Frame(content, bg=self.colors['bg_card'])
@@ -320,6 +469,137 @@ class ModernImageRenamer:
                                command=self.auto_preview)
             rb.pack(side='left', padx=6)
         
+        # Numbering order row
+        sort_frame = tk.Frame(content, bg=self.colors['bg_card'])
+        sort_frame.pack(fill='x', pady=(12, 0))
+        
+        tk.Label(sort_frame,
+                text="Order by:",
+                font=('Segoe UI', 10),
+                bg=self.colors['bg_card'],
+                fg=self.colors['text_primary']).pack(side='left', padx=(0, 10))
+        
+        self.sort_var = tk.StringVar(value="path")
+        
+        sort_modes = [
+            ("Path", "path"),
+            ("File name", "natural"),
+            ("Date taken", "captured"),
+            ("Date modified", "modified"),
+            ("Size", "size")
+        ]
+        
+        for text, value in sort_modes:
+            rb = tk.Radiobutton(sort_frame,
+                               text=text,
+                               variable=self.sort_var,
+                               value=value,
+                               font=('Segoe UI', 9),
+                               bg=self.colors['bg_card'],
+                               fg=self.colors['text_primary'],
+                               selectcolor=self.colors['bg_card'],
+                               activebackground=self.colors['hover'],
+                               highlightthickness=0,
+                               command=self.sort_files)
+            rb.pack(side='left', padx=6)
+        
+        # Duplicate handling row
+        dup_frame = tk.Frame(content, bg=self.colors['bg_card'])
+        dup_frame.pack(fill='x', pady=(12, 0))
+        
+        tk.Label(dup_frame,
+                text="Duplicates:",
+                font=('Segoe UI', 10),
+                bg=self.colors['bg_card'],
+                fg=self.colors['text_primary']).pack(side='left', padx=(0, 10))
+        
+        self.duplicate_mode_var = tk.StringVar(value="keep")
+        
+        duplicate_modes = [
+            ("Export all", "keep"),
+            ("Skip", "skip"),
+            ("Hard link to first copy", "link")
+        ]
+        
+        for text, value in duplicate_modes:
+            rb = tk.Radiobutton(dup_frame,
+                               text=text,
+                               variable=self.duplicate_mode_var,
+                               value=value,
+                               font=('Segoe UI', 9),
+                               bg=self.colors['bg_card'],
+                               fg=self.colors['text_primary'],
+                               selectcolor=self.colors['bg_card'],
+                               activebackground=self.colors['hover'],
+                               highlightthickness=0,
+                               command=self.auto_preview)
+            rb.pack(side='left', padx=6)
+        
+        # Existing export handling row
+        update_frame = tk.Frame(content, bg=self.colors['bg_card'])
+        update_frame.pack(fill='x', pady=(12, 0))
+        
+        tk.Label(update_frame,
+                text="Existing export:",
+                font=('Segoe UI', 10),
+                bg=self.colors['bg_card'],
+                fg=self.colors['text_primary']).pack(side='left', padx=(0, 10))
+        
+        self.update_mode_var = tk.StringVar(value="export")
+        
+        update_modes = [
+            ("Export anew", "export"),
+            ("Sync new & changed", "sync"),
+            ("Sync and remove stale", "prune")
+        ]
+        
+        for text, value in update_modes:
+            rb = tk.Radiobutton(update_frame,
+                               text=text,
+                               variable=self.update_mode_var,
+                               value=value,
+                               font=('Segoe UI', 9),
+                               bg=self.colors['bg_card'],
+                               fg=self.colors['text_primary'],
+                               selectcolor=self.colors['bg_card'],
+                               activebackground=self.colors['hover'],
+                               highlightthickness=0,
+                               command=self.refresh_collisions)
+            rb.pack(side='left', padx=6)
+        
+        # Name collision handling row
+        conflict_frame = tk.Frame(content, bg=self.colors['bg_card'])
+        conflict_frame.pack(fill='x', pady=(12, 0))
+        
+        tk.Label(conflict_frame,
+                text="If name exists:",
+                font=('Segoe UI', 10),
+                bg=self.colors['bg_card'],
+                fg=self.colors['text_primary']).pack(side='left', padx=(0, 10))
+        
+        self.conflict_mode_var = tk.StringVar(value="abort")
+        
+        conflict_modes = [
+            ("Stop", "abort"),
+            ("Skip", "skip"),
+            ("Add suffix", "suffix"),
+            ("Overwrite if newer", "newer")
+        ]
+        
+        for text, value in conflict_modes:
+            rb = tk.Radiobutton(conflict_frame,
+                               text=text,
+                               variable=self.conflict_mode_var,
+                               value=value,
+                               font=('Segoe UI', 9),
+                               bg=self.colors['bg_card'],
+                               fg=self.colors['text_primary'],
+                               selectcolor=self.colors['bg_card'],
+                               activebackground=self.colors['hover'],
+                               highlightthickness=0,
+                               command=self.refresh_collisions)
+            rb.pack(side='left', padx=6)
+        
         # Options row (delete originals toggle)
         options_frame = tk.Frame(content, bg=self.colors['bg_card'])
         options_frame.pack(fill='x', pady=(12, 0))
@@ -339,7 +619,7 @@ class ModernImageRenamer:
         
         # Warning label
         self.delete_warning_label = tk.Label(options_frame,
-                                             text="⚠ This cannot be undone!",
+                                             text="⚠ Originals are removed; Undo moves them back",
                                              font=('Segoe UI', 9),
                                              bg=self.colors['bg_card'],
                                              fg=self.colors['danger'])
@@ -353,6 +633,69 @@ class ModernImageRenamer:
         
         self.delete_originals_var.trace_add('write', toggle_warning)
         
+        # Read back and checksum every copy
+        self.verify_var = tk.BooleanVar(value=False)
+        
+        verify_cb = tk.Checkbutton(options_frame,
+                                   text="Verify copies",
+                                   variable=self.verify_var,
+                                   font=('Segoe UI', 9),
+                                   bg=self.colors['bg_card'],
+                                   fg=self.colors['text_primary'],
+                                   selectcolor='white',
+                                   activebackground=self.colors['bg_card'],
+                                   highlightthickness=0)
+        verify_cb.pack(side='right', padx=(12, 0))
+        
+        # Parallel copy threads
+        self.workers_var = tk.IntVar(value=engine.DEFAULT_WORKERS)
+        workers_spin = tk.Spinbox(options_frame,
+                                  from_=1,
+                                  to=32,
+                                  width=4,
+                                  textvariable=self.workers_var,
+                                  font=('Segoe UI', 9),
+                                  relief='sunken',
+                                  bd=1)
+        workers_spin.pack(side='right')
+        
+        tk.Label(options_frame,
+                text="Copy threads:",
+                font=('Segoe UI', 9),
+                bg=self.colors['bg_card'],
+                fg=self.colors['text_primary']).pack(side='right', padx=(0, 6))
+        
+        # Export mode row (how files are created when originals are kept)
+        mode_frame = tk.Frame(content, bg=self.colors['bg_card'])
+        mode_frame.pack(fill='x', pady=(12, 0))
+        
+        tk.Label(mode_frame,
+                text="Export as:",
+                font=('Segoe UI', 10),
+                bg=self.colors['bg_card'],
+                fg=self.colors['text_primary']).pack(side='left', padx=(0, 10))
+        
+        self.export_mode_var = tk.StringVar(value="copy")
+        
+        modes = [
+            ("Copy", "copy"),
+            ("Clone (copy-on-write)", "reflink"),
+            ("Hard link", "hardlink")
+        ]
+        
+        for text, value in modes:
+            rb = tk.Radiobutton(mode_frame,
+                               text=text,
+                               variable=self.export_mode_var,
+                               value=value,
+                               font=('Segoe UI', 9),
+                               bg=self.colors['bg_card'],
+                               fg=self.colors['text_primary'],
+                               selectcolor=self.colors['bg_card'],
+                               activebackground=self.colors['hover'],
+                               highlightthickness=0)
+            rb.pack(side='left', padx=6)
+        
         # Export location row
         export_loc_frame = tk.Frame(content, bg=self.colors['bg_card'])
         export_loc_frame.pack(fill='x', pady=(12, 0))
@@ -404,22 +747,44 @@ class ModernImageRenamer:
         content.grid_rowconfigure(0, weight=1)
         content.grid_columnconfigure(0, weight=1)
         
-        # Treeview for preview with subtle sunken border
-        tree_frame = tk.Frame(content, bg='white', relief='sunken', bd=1)
-        tree_frame.pack(fill='both', expand=True, pady=(0, 10))
-        
-        # Scrollbar
-        scrollbar = tk.Scrollbar(tree_frame)
-        scrollbar.pack(side='right', fill='y')
-        
-        # Remove fixed height - let it expand naturally
-        self.preview_tree = ttk.Treeview(tree_frame,
-                                        columns=('Original', 'Arrow', 'New'),
-                                        show='headings',
-                                        style='Modern.Treeview',
-                                        yscrollcommand=scrollbar.set)
-        
-        scrollbar.config(command=self.preview_tree.yview)
+        # List and thumbnail grid side by side
+        self.preview_panes = tk.PanedWindow(content,
+                                            orient='horizontal',
+                                            sashwidth=6,
+                                            bd=0,
+                                            bg=self.colors['bg_card'])
+        self.preview_panes.pack(fill='both', expand=True, pady=(0, 10))
+        
+        # Treeview for preview with subtle sunken border; only the rows on
+        # screen exist in the widget, the rest are built while scrolling
+        self.preview_view = VirtualTreeview(self.preview_panes,
+                                            rowheight=26,
+                                            bg='white',
+                                            columns=('Original', 'Arrow', 'New'),
+                                            show='headings',
+                                            style='Modern.Treeview')
+        self.preview_view.config(relief='sunken', bd=1)
+        self.preview_view.on_view_change = self.on_preview_scrolled
+        self.preview_panes.add(self.preview_view, stretch='always', minsize=320)
+        self.preview_tree = self.preview_view.tree
+        
+        # Thumbnail grid; follows the list's scroll position
+        self.thumbnail_grid = ThumbnailGrid(self.preview_panes,
+                                            thumb_size=THUMB_BOX,
+                                            bg='white',
+                                            fg=self.colors['text_primary'],
+                                            select_bg=self.colors['selection'],
+                                            placeholder_bg=self.colors['bg_secondary'])
+        self.thumbnail_grid.config(relief='sunken', bd=1)
+        self.thumbnail_grid.set_source(0, self.thumbnail_cell)
+        self.thumbnail_grid.on_click = self.on_thumbnail_click
+        self.thumbnail_grid.on_double_click = self.on_thumbnail_double_click
+        self.thumbnail_grid.on_wheel = lambda rows: self.preview_view.scroll_rows(
+            rows * self.thumbnail_grid.columns)
+        self.thumbnail_grid.on_resize = self.refresh_thumbnail_grid
+        self.thumbnails_shown = False
+        if PIL_AVAILABLE:
+            self.toggle_thumbnails()
         
         # Configure columns - use percentages for responsive width
         self.preview_tree.heading('Original', text='Original Name')
@@ -430,7 +795,15 @@ class ModernImageRenamer:
         self.preview_tree.column('Arrow', width=40, minwidth=30, anchor='center')
         self.preview_tree.column('New', width=400, minwidth=150, anchor='w')
         
-        self.preview_tree.pack(fill='both', expand=True)
+        # Configure row colors - subtle alternating
+        self.preview_tree.tag_configure('evenrow', background='#F5F5F5')
+        self.preview_tree.tag_configure('oddrow', background='white')
+        self.preview_tree.tag_configure('duplicate', foreground=self.colors['warning'])
+        self.preview_tree.tag_configure('collision', foreground=self.colors['danger'])
+        # Near-duplicate clusters alternate between two tints
+        self.preview_tree.tag_configure('similar0', background='#E6F0F8')
+        self.preview_tree.tag_configure('similar1', background='#EEF6E6')
+        
         self.preview_tree.bind('<Double-1>', self.open_image_preview)
         self.preview_tree.bind('<Delete>', self.remove_selected_images)
         self.preview_tree.bind('<BackSpace>', self.remove_selected_images)
@@ -459,6 +832,20 @@ class ModernImageRenamer:
                                     state='disabled')
         self.rename_btn.pack(side='left', padx=(0, 4))
         
+        thumbs_btn = ttk.Button(btn_frame,
+                               text="Thumbnails",
+                               command=self.toggle_thumbnails,
+                               style='Secondary.TButton',
+                               state='normal' if PIL_AVAILABLE else 'disabled')
+        thumbs_btn.pack(side='left', padx=(0, 4))
+        
+        similar_btn = ttk.Button(btn_frame,
+                                 text="Group Similar",
+                                 command=self.group_similar,
+                                 style='Secondary.TButton',
+                                 state='normal' if similar.SIMILAR_AVAILABLE else 'disabled')
+        similar_btn.pack(side='left', padx=(0, 4))
+        
         remove_btn = ttk.Button(btn_frame,
                              text="Remove",
                              command=self.remove_selected_images,
@@ -471,6 +858,12 @@ class ModernImageRenamer:
                              style='Secondary.TButton')
         undo_btn.pack(side='left', padx=(0, 4))
         
+        history_btn = ttk.Button(btn_frame,
+                                text="History",
+                                command=self.show_history,
+                                style='Secondary.TButton')
+        history_btn.pack(side='left', padx=(0, 4))
+        
         help_btn = ttk.Button(btn_frame,
                              text="Help",
                              command=self.show_help,
@@ -510,6 +903,17 @@ class ModernImageRenamer:
                                       fg=self.colors['success'])
         self.progress_label.pack(side='left', padx=(16, 0))
         
+        # Export progress bar and cancel button (shown only while exporting)
+        self.cancel_btn = ttk.Button(inner,
+                                     text="Cancel",
+                                     command=self.cancel_export,
+                                     style='Secondary.TButton')
+        self.progress_bar = ttk.Progressbar(inner,
+                                            orient='horizontal',
+                                            length=200,
+                                            mode='determinate',
+                                            style='Modern.Horizontal.TProgressbar')
+        
         # Help hints on right
         help_label = tk.Label(inner,
                             text="F1 Help  •  Ctrl+O Open  •  Del Remove  •  Ctrl+Z Undo",
@@ -529,20 +933,25 @@ class ModernImageRenamer:
         self.path_entry.dnd_bind('<<Drop>>', self.handle_drop)
     
     def handle_drop(self, event):
-        """Handle drag-and-drop of files"""
+        """Handle drag-and-drop of files and folders"""
         file_paths = list(self.root.tk.splitlist(event.data))
         if not file_paths:
             return
         
-        self.selected_files = file_paths
-        self.current_folder = os.path.dirname(self.selected_files[0])
+        if any(os.path.isdir(p) for p in file_paths):
+            self.start_folder_scan(file_paths)
+            return
+        
+        # Stops a folder scan still adding to the old selection
+        self.reset_selection()
+        self.selected_files = dict.fromkeys(file_paths)
+        self.current_folder = os.path.dirname(file_paths[0])
         self.path_entry.config(state='normal')
         self.path_entry.delete(0, tk.END)
         self.path_entry.insert(0, f"{len(self.selected_files)} files selected")
         self.path_entry.config(state='readonly')
         
         self.scan_selection()
-        self.update_status(f"Loaded {len(self.selected_files)} image files", 'success')
     
     def create_card(self, parent, title):
         """Create a modern group box style container with classic inspiration"""
@@ -571,13 +980,15 @@ class ModernImageRenamer:
         file_paths = filedialog.askopenfilenames(
             title="Select images to rename",
             filetypes=[
-                ("Image files", "*.jpg *.jpeg *.png *.gif *.bmp *.webp *.tiff *.tif"),
+                ("Image files", " ".join("*" + ext for ext in engine.VALID_EXTENSIONS)),
                 ("All files", "*.*")
             ]
         )
         if file_paths:
-            self.selected_files = list(file_paths)
-            self.current_folder = os.path.dirname(self.selected_files[0])
+            # Stops a folder scan still adding to the old selection
+            self.reset_selection()
+            self.selected_files = dict.fromkeys(file_paths)
+            self.current_folder = os.path.dirname(file_paths[0])
             self.path_entry.config(state='normal')
             self.path_entry.delete(0, tk.END)
             self.path_entry.insert(0, f"{len(self.selected_files)} files selected")
@@ -585,43 +996,274 @@ class ModernImageRenamer:
             
             # Scan selected files
             self.scan_selection()
-            self.update_status(f"Loaded {len(self.selected_files)} image files", 'success')
+    
+    def browse_folder(self):
+        """Pick a folder and load every image in its tree"""
+        directory = filedialog.askdirectory(title="Select a folder of images")
+        if directory:
+            self.start_folder_scan([directory])
+    
+    def start_folder_scan(self, paths):
+        """Walk folders on a worker thread, adding images to the list in batches"""
+        roots = [p for p in paths if os.path.isdir(p)]
+        files = [p for p in paths if not os.path.isdir(p)]
+        
+        self.reset_selection()
+        self.current_folder = roots[0]
+        
+        scan_queue = queue.Queue()
+        scan_cancel = threading.Event()
+        index = self.library_index
+        
+        def worker():
+            try:
+                if files:
+                    # Loose files dropped along with the folders go first
+                    images = engine.scan_images(files, workers=DETECT_WORKERS, index=index)
+                    scan_queue.put(('batch', files, images))
+                found = engine.walk_files(roots, cancel=scan_cancel)
+                for batch in engine.iter_batches(found, SCAN_BATCH_SIZE):
+                    # Header sniffing happens here, off the Tk thread
+                    images = engine.filter_images(batch, workers=DETECT_WORKERS, index=index)
+                    scan_queue.put(('batch', batch, images))
+                scan_queue.put(('done', None))
+            except Exception as e:
+                scan_queue.put(('error', e))
+        
+        self.scan_queue = scan_queue
+        self.scan_cancel = scan_cancel
+        self.scan_thread = threading.Thread(target=worker, daemon=True)
+        self.scan_thread.start()
+        self.update_status(f"Scanning {os.path.basename(roots[0]) or roots[0]}...", 'info')
+        self.root.after(100, self.poll_folder_scan, scan_queue)
+    
+    def cancel_folder_scan(self):
+        """Stop a running folder scan, keeping what was found so far"""
+        if self.scan_cancel is not None:
+            self.scan_cancel.set()
+        self.scan_thread = None
+        self.scan_queue = None
+        self.scan_cancel = None
+    
+    def poll_folder_scan(self, scan_queue):
+        """Move scanned batches into the list; reschedules itself while scanning"""
+        if scan_queue is not self.scan_queue:
+            # Scan was cancelled or replaced by a newer one
+            return
+        
+        finished = None
+        added = False
+        try:
+            # Bounded per tick so the UI stays responsive on huge trees
+            for _ in range(SCAN_BATCHES_PER_POLL):
+                message = self.scan_queue.get_nowait()
+                if message[0] != 'batch':
+                    finished = message
+                    break
+                self.add_scanned_files(message[1], message[2])
+                added = True
+        except queue.Empty:
+            pass
+        
+        if added:
+            self.update_selection_labels()
+            if self.preview_data and self.preview_source is self.files_to_rename:
+                self.preview_view.set_count(len(self.files_to_rename))
+            else:
+                self.auto_preview()
+            self.update_status(f"Scanning... {len(self.files_to_rename)} images found", 'info')
+        
+        if finished is None:
+            self.root.after(100, self.poll_folder_scan, scan_queue)
+            return
+        
+        self.cancel_folder_scan()
+        if finished[0] == 'error':
+            self.update_status(f"Error scanning folder: {str(finished[1])}", 'error')
+        
+        if not self.files_to_rename:
+            self.reset_selection()
+            self.show_warning(
+                "No Images Found",
+                "No image files were found in the selected folder."
+            )
+            return
+        
+        # Sort once at the end so numbering matches a plain file selection
+        self.files_to_rename.sort()
+        self.preview_source = None
+        self.update_selection_labels()
+        self.auto_preview()
+        self.update_status(f"Loaded {len(self.files_to_rename)} image files", 'success')
+        self.sort_files()
+    
+    def add_scanned_files(self, batch, images):
+        """Append newly found files, skipping ones already in the list"""
+        new_images = [p for p in images if p not in self.selected_files]
+        self.selected_files.update(dict.fromkeys(batch))
+        self.files_to_rename.extend(new_images)
+    
+    def update_selection_labels(self):
+        """Refresh the path entry and image counter from the current lists"""
+        self.path_entry.config(state='normal')
+        self.path_entry.delete(0, tk.END)
+        self.path_entry.insert(0, f"{len(self.selected_files)} files selected")
+        self.path_entry.config(state='readonly')
+        
+        count = len(self.files_to_rename)
+        self.file_count_label.config(
+            text=f"{count} image{'s' if count != 1 else ''} selected",
+            fg=self.colors['success'] if count > 0 else self.colors['warning']
+        )
+        if count > 0:
+            self.clear_btn.config(state='normal')
     
     def scan_selection(self):
-        """Scan selected files for image types"""
+        """Scan selected files for image types on a worker thread.
+
+        Reading headers (or the index's stat and EXIF lookups) touches every
+        file, so the result is only swapped in once it is ready.
+        """
         if not self.selected_files:
             return
         
-        valid_exts = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.tif')
+        selection = self.selected_files
+        paths = list(selection)
+        selection_queue = queue.Queue()
+        
+        def worker():
+            try:
+                selection_queue.put(('done', engine.scan_images(paths, workers=DETECT_WORKERS,
+                                                                index=self.library_index)))
+            except Exception as e:
+                selection_queue.put(('error', e))
+        
+        self.selection_queue = selection_queue
+        threading.Thread(target=worker, daemon=True).start()
+        self.update_status(f"Checking {len(paths)} files...", 'info')
+        self.root.after(100, self.poll_selection, selection_queue, selection, len(paths))
+    
+    def poll_selection(self, selection_queue, selection, count):
+        """Show the scanned selection unless it was replaced meanwhile"""
+        if selection_queue is not self.selection_queue:
+            return
         try:
-            self.files_to_rename = [
-                f for f in self.selected_files if f.lower().endswith(valid_exts)
-            ]
-            self.files_to_rename.sort()
-            
-            count = len(self.files_to_rename)
-            self.file_count_label.config(
-                text=f"{count} image{'s' if count != 1 else ''} selected",
-                fg=self.colors['success'] if count > 0 else self.colors['warning']
+            message = selection_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_selection, selection_queue, selection, count)
+            return
+        
+        self.selection_queue = None
+        if selection is not self.selected_files or len(selection) != count:
+            # Selection replaced or rows removed while scanning
+            return
+        if message[0] == 'error':
+            self.update_status(f"Error scanning selection: {str(message[1])}", 'error')
+            self.show_error("Error", f"Could not scan selection:\n{str(message[1])}")
+            return
+        
+        self.files_to_rename = message[1]
+        count = len(self.files_to_rename)
+        self.file_count_label.config(
+            text=f"{count} image{'s' if count != 1 else ''} selected",
+            fg=self.colors['success'] if count > 0 else self.colors['warning']
+        )
+        
+        if count > 0:
+            self.clear_btn.config(state='normal')
+            self.auto_preview()
+            self.sort_files()
+            self.update_status(f"Loaded {count} image files", 'success')
+        else:
+            self.clear_preview()
+            self.show_warning(
+                "No Images Found",
+                "No image files were selected.\n\nSupported formats: JPG, PNG, GIF, BMP, WEBP, TIFF, "
+                "HEIC, AVIF, JPEG XL and common RAW formats"
             )
-            
-            if count > 0:
-                self.clear_btn.config(state='normal')
+    
+    def sort_files(self):
+        """Reorder the list by the chosen mode on a worker thread.
+
+        Path order is what scanning already produces; the other modes may
+        read every file's header, so the list is swapped in when done.
+        """
+        self.sort_queue = None
+        files = self.files_to_rename
+        mode = self.sort_var.get()
+        if not files or self.scan_thread is not None:
+            # A running folder scan sorts when it finishes
+            return
+        if mode == 'path':
+            if files != sorted(files):
+                self.files_to_rename = sorted(files)
+                if self.duplicates_source is files:
+                    self.duplicates_source = self.files_to_rename
                 self.auto_preview()
-            else:
-                self.clear_preview()
-                self.show_warning(
-                    "No Images Found",
-                    "No image files were selected.\n\nSupported formats: JPG, PNG, GIF, BMP, WEBP, TIFF"
-                )
-        except Exception as e:
-            self.update_status(f"Error scanning selection: {str(e)}", 'error')
-            self.show_error("Error", f"Could not scan selection:\n{str(e)}")
+            return
+        
+        sort_queue = queue.Queue()
+        
+        def worker():
+            try:
+                sort_queue.put(('done', engine.sort_images(list(files), mode, index=self.library_index)))
+            except Exception as e:
+                sort_queue.put(('error', e))
+        
+        self.sort_queue = sort_queue
+        threading.Thread(target=worker, daemon=True).start()
+        self.update_status(f"Sorting {len(files)} images...", 'info')
+        self.root.after(100, self.poll_sort, sort_queue, files, len(files))
+    
+    def poll_sort(self, sort_queue, files, count):
+        """Swap in the sorted list unless the list changed meanwhile"""
+        if sort_queue is not self.sort_queue:
+            return
+        try:
+            message = sort_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_sort, sort_queue, files, count)
+            return
+        
+        self.sort_queue = None
+        if files is not self.files_to_rename or len(files) != count:
+            # Rows were removed or the selection replaced while sorting
+            return
+        if message[0] == 'error':
+            self.update_status(f"Error sorting files: {str(message[1])}", 'error')
+            return
+        self.files_to_rename = message[1]
+        if self.duplicates_source is files:
+            # Same files, only reordered; no need to hash them again
+            self.duplicates_source = self.files_to_rename
+        self.auto_preview()
+        self.update_status(f"Sorted {count} images", 'success')
+    
+    def schedule_preview(self):
+        """Debounce preview updates while the user is typing"""
+        if self.preview_after_id is not None:
+            self.root.after_cancel(self.preview_after_id)
+        self.preview_after_id = self.root.after(PREVIEW_DEBOUNCE_MS, self.auto_preview)
     
     def auto_preview(self):
         """Automatically update preview when settings change"""
-        if self.files_to_rename:
-            self.preview_rename()
+        self.preview_after_id = None
+        if not self.files_to_rename:
+            return
+        
+        base_name = self.name_entry.get().strip()
+        if not base_name:
+            # No dialog here; this runs while the user is still typing
+            self.update_status("Enter a base name to see the preview", 'warning')
+            return
+        
+        # Arrow keys, Shift etc. don't change anything worth redrawing
+        if (self.preview_data and self.preview_source is self.files_to_rename
+                and self.preview_key == (base_name, self.format_var.get(),
+                                         self.duplicate_mode_var.get())):
+            return
+        
+        self.preview_rename()
     
     def preview_rename(self):
         """Generate and display rename preview"""
@@ -640,56 +1282,328 @@ class ModernImageRenamer:
             )
             return
         
-        # Clear existing preview
-        self.clear_preview()
-        
         # Generate preview data
-        self.preview_data = []
         format_type = self.format_var.get()
-        
-        self.preview_item_paths = {}
-        for i, file_path in enumerate(self.files_to_rename, 1):
-            filename = os.path.basename(file_path)
-            ext = os.path.splitext(filename)[1]
-            
-            # Apply selected format
-            if format_type == "parentheses":
-                new_name = f"{base_name} ({i}){ext}"
-            elif format_type == "underscore":
-                new_name = f"{base_name}_{i}{ext}"
-            elif format_type == "dash":
-                new_name = f"{base_name}-{i}{ext}"
-            else:  # space
-                new_name = f"{base_name} {i}{ext}"
-            
-            self.preview_data.append((file_path, new_name))
-            
-            # Add to tree with alternating colors
-            tag = 'evenrow' if i % 2 == 0 else 'oddrow'
-            item_id = self.preview_tree.insert('', 'end', values=(filename, '→', new_name), tags=(tag,))
-            self.preview_item_paths[item_id] = file_path
-        
-        # Configure row colors - subtle alternating
-        self.preview_tree.tag_configure('evenrow', background='#F5F5F5')
-        self.preview_tree.tag_configure('oddrow', background='white')
+        duplicate_mode = self.duplicate_mode_var.get()
+        plan = engine.plan_rename(self.files_to_rename, base_name, format_type,
+                                  skip=self.current_duplicates() if duplicate_mode == 'skip' else None)
+        
+        if self.preview_data and self.preview_source is self.files_to_rename:
+            # Same files: only the new names changed, redraw rows in place
+            # and keep the scroll position and selection
+            self.preview_data = plan
+            self.preview_view.refresh()
+        else:
+            self.clear_preview()
+            self.preview_data = plan
+            self.preview_source = self.files_to_rename
+            self.preview_view.set_rows(len(self.preview_data), self.preview_row)
+            if self.duplicates_source is not self.files_to_rename and self.scan_thread is None:
+                # A running folder scan searches once it has every file
+                self.start_duplicate_scan()
+        self.preview_key = (base_name, format_type, duplicate_mode)
+        
+        output_dir = engine.resolve_output_dir(base_name, self.custom_export_dir)
+        if output_dir != self.existing_dir:
+            self.start_collision_scan(output_dir)
         
         # Enable rename button
         self.rename_btn.config(state='normal')
-        self.update_status(f"Preview ready: {len(self.preview_data)} files will be exported", 'info')
+        self.update_status(f"Preview ready: {self.preview_data.target_count()} files will be exported", 'info')
+    
+    def preview_row(self, index):
+        """Build the tree values for one preview row on demand"""
+        file_path, new_name = self.preview_data[index]
+        # Alternating colors, counted from 1 like the numbering
+        tag = 'evenrow' if (index + 1) % 2 == 0 else 'oddrow'
+        arrow = '→'
+        cluster = self.current_similar().get(file_path)
+        if cluster is not None:
+            tag = f'similar{cluster % 2}'
+            arrow = '≈'
+        original = self.current_duplicates().get(file_path)
+        if new_name is None:
+            # Skipped duplicate; the map is briefly empty while it is recomputed
+            new_name = (f"skipped, same as {os.path.basename(original)}"
+                        if original is not None else "skipped (duplicate)")
+            return (os.path.basename(file_path), '=', new_name), (tag, 'duplicate')
+        if original is not None:
+            return (os.path.basename(file_path), '=', new_name), (tag, 'duplicate')
+        if engine.name_key(new_name) in self.current_collisions():
+            note = {
+                'abort': "exists",
+                'skip': "exists, skipped",
+                'suffix': "exists, numbered (2)",
+                'newer': "exists, replaced if older",
+            }[self.conflict_mode_var.get()]
+            return (os.path.basename(file_path), '!', f"{new_name} ({note})"), (tag, 'collision')
+        return (os.path.basename(file_path), arrow, new_name), (tag,)
+    
+    def current_similar(self):
+        """Cluster numbers for the current list, empty if not grouped"""
+        if self.similar_source is self.files_to_rename:
+            return self.similar_groups
+        return {}
+    
+    def group_similar(self):
+        """Cluster near-duplicate images on a worker thread and list them together"""
+        files = self.files_to_rename
+        if not files or self.similar_queue is not None:
+            return
+        similar_queue = queue.Queue()
+        snapshot = list(files)
+        
+        def worker():
+            try:
+                groups = similar.find_similar(snapshot, workers=DETECT_WORKERS,
+                                              cache=self.thumbnail_cache)
+                similar_queue.put(('done', groups))
+            except Exception as e:
+                similar_queue.put(('error', e))
+        
+        self.similar_queue = similar_queue
+        threading.Thread(target=worker, daemon=True).start()
+        self.update_status(f"Looking for similar images among {len(files)} files...", 'info')
+        self.root.after(100, self.poll_similar, similar_queue, files, len(files))
+    
+    def poll_similar(self, similar_queue, files, count):
+        """Reorder the list so each cluster's images sit together"""
+        if similar_queue is not self.similar_queue:
+            return
+        try:
+            message = similar_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_similar, similar_queue, files, count)
+            return
+        
+        self.similar_queue = None
+        if message[0] == 'error':
+            self.update_status(f"Error grouping similar images: {str(message[1])}", 'error')
+            return
+        if files is not self.files_to_rename or len(files) != count:
+            # The list changed while hashing
+            self.update_status("List changed; run Group Similar again", 'warning')
+            return
+        
+        groups = message[1]
+        if not groups:
+            self.update_status("No similar images found", 'info')
+            return
+        
+        self.files_to_rename = similar.group_together(files, groups)
+        self.similar_groups = {path: n for n, group in enumerate(groups) for path in group}
+        self.similar_source = self.files_to_rename
+        if self.duplicates_source is files:
+            # Same files, only reordered; no need to hash them again
+            self.duplicates_source = self.files_to_rename
+        self.auto_preview()
+        clustered = sum(len(group) for group in groups)
+        self.update_status(f"Grouped {clustered} similar images in {len(groups)} clusters", 'success')
+    
+    def current_collisions(self):
+        """Existing names in the preview's output folder, empty for syncs"""
+        if self.update_mode_var.get() != 'export':
+            return set()
+        return self.existing_names
+    
+    def start_collision_scan(self, output_dir):
+        """List the output folder on a worker thread to flag taken names"""
+        self.existing_names = set()
+        self.existing_dir = output_dir
+        collision_queue = queue.Queue()
+        
+        def worker():
+            try:
+                collision_queue.put(('done', engine.output_names(output_dir)))
+            except Exception as e:
+                collision_queue.put(('error', e))
+        
+        self.collision_queue = collision_queue
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, self.poll_collisions, collision_queue)
+    
+    def poll_collisions(self, collision_queue):
+        """Flag rows whose new name is already taken"""
+        if collision_queue is not self.collision_queue:
+            return
+        try:
+            message = collision_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_collisions, collision_queue)
+            return
+        
+        self.collision_queue = None
+        if message[0] == 'error':
+            return
+        self.existing_names = message[1]
+        self.refresh_collisions()
+    
+    def count_collisions(self):
+        """Planned names that already exist in the output folder"""
+        existing = self.current_collisions()
+        if not existing or not self.preview_data:
+            return 0
+        return len(engine.find_collisions(self.preview_data, self.existing_dir, existing))
+    
+    def forget_output_listing(self):
+        """Drop the output folder listing so the next preview lists it again"""
+        self.existing_names = set()
+        self.existing_dir = None
+        self.collision_queue = None
+    
+    def refresh_collisions(self):
+        """Redraw the preview after the folder listing or strategy changed"""
+        if not self.preview_data:
+            return
+        self.preview_view.refresh()
+        collisions = self.count_collisions()
+        if collisions:
+            self.update_status(f"{collisions} file name(s) already exist in the output folder", 'warning')
+    
+    def current_duplicates(self):
+        """Duplicate map for the current list, empty while it is being computed"""
+        if self.duplicates_source is self.files_to_rename:
+            return self.duplicates
+        return {}
+    
+    def start_duplicate_scan(self):
+        """Look for identical files in the list on a worker thread"""
+        files = self.files_to_rename
+        self.duplicates = {}
+        self.duplicates_source = None
+        duplicate_queue = queue.Queue()
+        snapshot = list(files)
+        
+        def worker():
+            try:
+                groups = duplicates.find_duplicates(snapshot, workers=DETECT_WORKERS,
+                                                    index=self.library_index)
+                duplicate_queue.put(('done', duplicates.duplicate_map(groups), len(groups)))
+            except Exception as e:
+                duplicate_queue.put(('error', e))
+        
+        self.duplicate_queue = duplicate_queue
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, self.poll_duplicates, duplicate_queue, files, len(snapshot))
+    
+    def poll_duplicates(self, duplicate_queue, files, count):
+        """Flag duplicates in the preview once the search finishes"""
+        if duplicate_queue is not self.duplicate_queue:
+            return
+        try:
+            message = duplicate_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_duplicates, duplicate_queue, files, count)
+            return
+        
+        self.duplicate_queue = None
+        if message[0] == 'error' or files is not self.files_to_rename:
+            return
+        if len(files) != count:
+            # Rows were removed meanwhile; look again at what is left
+            self.start_duplicate_scan()
+            return
+        self.duplicates = message[1]
+        self.duplicates_source = files
+        if not self.duplicates:
+            return
+        if self.duplicate_mode_var.get() == 'skip':
+            # Numbering changes: rebuild the plan without the duplicates
+            self.preview_key = None
+            self.auto_preview()
+        else:
+            self.preview_view.refresh()
+        self.update_status(f"Found {len(self.duplicates)} duplicate file(s) in {message[2]} group(s)",
+                           'warning')
+    
+    def toggle_thumbnails(self):
+        """Show or hide the thumbnail grid next to the list"""
+        if self.thumbnails_shown:
+            self.preview_panes.forget(self.thumbnail_grid)
+            self.thumbnails_shown = False
+            self.thumbnail_prefetcher.cancel()
+        else:
+            self.preview_panes.add(self.thumbnail_grid, minsize=THUMB_BOX[0] + 20, width=300)
+            self.thumbnails_shown = True
+            self.refresh_thumbnail_grid()
+    
+    def thumbnail_cell(self, index):
+        """Photo, caption and selection state for one grid cell"""
+        file_path, new_name = self.preview_data[index]
+        photo = self.thumbnail_photos.get(file_path)
+        caption = new_name or f"({os.path.basename(file_path)})"
+        return photo, caption, index in self.preview_view.selected
+    
+    def refresh_thumbnail_grid(self):
+        """Redraw the grid at the list's current position"""
+        self.on_preview_scrolled(self.preview_view.offset, self.preview_view.visible_rows)
+    
+    def on_preview_scrolled(self, offset, shown):
+        """Keep the grid in step with the list and prefetch around the view"""
+        if not self.thumbnails_shown:
+            return
+        count = len(self.preview_data)
+        self.thumbnail_grid.show(offset, count)
+        
+        # Visible rows first, then the next pages, then the previous one
+        span = max(shown, self.thumbnail_grid.capacity)
+        order = list(range(offset, min(count, offset + span)))
+        order += range(offset + span, min(count, offset + span * (1 + PREFETCH_PAGES)))
+        order += range(max(0, offset - span), offset)
+        wanted = []
+        for index in order:
+            path = self.preview_data[index][0]
+            if path not in self.thumbnail_failed and self.thumbnail_photos.get(path) is None:
+                wanted.append(path)
+        self.thumbnail_prefetcher.schedule(wanted)
+    
+    def poll_thumbnails(self):
+        """Turn decoded thumbnails into PhotoImages on the Tk thread"""
+        arrived = False
+        dropped = False
+        try:
+            for _ in range(THUMBS_PER_POLL):
+                generation, path, image = self.thumbnail_prefetcher.results.get_nowait()
+                if generation != self.thumbnail_prefetcher.generation:
+                    # Started before the list changed; schedule skipped it
+                    # while in flight, so it has to be asked for again
+                    dropped = True
+                    continue
+                if image is None:
+                    self.thumbnail_failed.add(path)
+                else:
+                    self.thumbnail_photos.put(path, ImageTk.PhotoImage(image))
+                arrived = True
+        except queue.Empty:
+            pass
+        
+        if dropped and self.thumbnails_shown:
+            self.refresh_thumbnail_grid()
+        elif arrived and self.thumbnails_shown:
+            self.thumbnail_grid.redraw()
+        self.root.after(50 if arrived else 150, self.poll_thumbnails)
+    
+    def on_thumbnail_click(self, index):
+        self.preview_tree.focus_set()
+        self.preview_view.select_index(index)
+    
+    def on_thumbnail_double_click(self, index):
+        self.on_thumbnail_click(index)
+        self.open_image_preview()
     
     def open_image_preview(self, event=None):
         """Open a larger preview of the selected image"""
-        item_id = None
+        index = None
         if event is not None:
-            item_id = self.preview_tree.identify_row(event.y)
-        if not item_id:
-            selected = self.preview_tree.selection()
-            item_id = selected[0] if selected else None
+            index = self.preview_view.index_at(event.y)
+        if index is None:
+            selected = self.preview_view.selected_indexes()
+            index = selected[0] if selected else None
         
-        if not item_id:
+        if index is None or index >= len(self.preview_data):
             return
         
-        image_path = self.preview_item_paths.get(item_id)
+        image_path = self.preview_data[index][0]
         if not image_path or not os.path.exists(image_path):
             self.show_error("Image Not Found", "The selected image could not be found.")
             return
@@ -720,9 +1634,14 @@ class ModernImageRenamer:
         
         try:
             if PIL_AVAILABLE:
-                image = Image.open(image_path)
-                image.thumbnail((860, 580), Image.LANCZOS)
-                photo = ImageTk.PhotoImage(image)
+                # Recently shown previews are reused as-is; older ones come
+                # from the on-disk thumbnail cache instead of the original
+                key = self.thumbnail_cache.key(image_path, PREVIEW_BOX)
+                photo = self.photo_cache.get(key)
+                if photo is None:
+                    image = self.thumbnail_cache.load(image_path, PREVIEW_BOX)
+                    photo = ImageTk.PhotoImage(image)
+                    self.photo_cache.put(key, photo)
             else:
                 photo = tk.PhotoImage(file=image_path)
         except Exception as e:
@@ -752,140 +1671,332 @@ class ModernImageRenamer:
     
     def execute_rename(self):
         """Execute the actual file renaming"""
+        if self.export_thread is not None:
+            return
+        
         if not self.preview_data:
             self.show_warning("No Preview", "Please preview changes first.")
             return
         
         # Check if deleting originals
         delete_originals = self.delete_originals_var.get()
+        count = self.preview_data.target_count()
+        update_mode = self.update_mode_var.get()
+        on_conflict = self.conflict_mode_var.get()
+        collisions = self.count_collisions()
+        if collisions and on_conflict == 'abort':
+            self.show_warning(
+                "Name Collision",
+                f"{collisions} of the new names already exist in the output folder "
+                "(marked in red in the preview).\n\n"
+                "Choose what to do with them under 'If name exists', "
+                "or change the base name."
+            )
+            return
+        conflict_note = {
+            'skip': f"\n\n{collisions} files whose name already exists will be skipped.",
+            'suffix': f"\n\n{collisions} files whose name already exists get a numbered suffix.",
+            'newer': f"\n\n⚠ {collisions} existing files will be overwritten where the source is newer.",
+        }.get(on_conflict, "") if collisions else ""
         
         # Confirmation dialog with appropriate warning
-        if delete_originals:
+        if update_mode != 'export':
+            confirm = self.ask_confirm(
+                "Confirm Sync",
+                f"Update the existing export with these {count} files?\n\n"
+                "Only new and changed files are copied; exported files keep their names."
+                + ("\n\n⚠ Exported files whose source is no longer listed will be deleted!"
+                   if update_mode == 'prune' else "")
+                + ("\n\n⚠ WARNING: Original files will be removed from their folders!"
+                   if delete_originals else "")
+            )
+        elif delete_originals:
             confirm = self.ask_confirm(
                 "Confirm Export & Delete",
-                f"Are you sure you want to export {len(self.preview_data)} files?\n\n"
-                "⚠ WARNING: Original files will be PERMANENTLY DELETED!\n"
-                "This cannot be undone!"
+                f"Are you sure you want to export {count} files?\n\n"
+                "⚠ WARNING: Original files will be removed from their folders!\n"
+                "Undo moves the exported files back to where the originals were." + conflict_note
             )
         else:
             confirm = self.ask_confirm(
                 "Confirm Export",
-                f"Are you sure you want to export {len(self.preview_data)} files?\n\n"
-                "Original files will be kept. You can undo this action."
+                f"Are you sure you want to export {count} files?\n\n"
+                "Original files will be kept. You can undo this action." + conflict_note
             )
         
         if not confirm:
             return
         
+        base_name = self.name_entry.get().strip()
+        if not base_name:
+            self.show_warning(
+                "Missing Base Name",
+                "Please enter a base name for the files."
+            )
+            return
+        
+        output_dir = engine.resolve_output_dir(base_name, self.custom_export_dir)
+        self.start_export(list(self.preview_data), output_dir, base_name, delete_originals,
+                          on_conflict=on_conflict, sync=update_mode != 'export',
+                          prune=update_mode == 'prune')
+    
+    def start_export(self, plan, output_dir, base_name, delete_originals, on_conflict='abort',
+                     sync=False, prune=False):
+        """Run the export on a worker thread and poll its progress"""
+        self.export_queue = queue.Queue()
+        self.export_cancel = threading.Event()
+        self.export_job = {
+            'plan': plan,
+            'output_dir': output_dir,
+            'base_name': base_name,
+            'delete_originals': delete_originals,
+            'started': time.monotonic(),
+            'done': 0,
+            'total': sum(1 for _, new_name in plan if new_name is not None),
+            'bytes': 0
+        }
+        
+        def progress(done, total, new_path, nbytes):
+            self.export_queue.put(('progress', done, total, nbytes))
+        
         try:
-            base_name = self.name_entry.get().strip()
-            if not base_name:
-                self.show_warning(
-                    "Missing Base Name",
-                    "Please enter a base name for the files."
-                )
-                return
-            
-            # Use custom export directory or default to script directory
-            if self.custom_export_dir:
-                export_base = self.custom_export_dir
+            workers = max(1, int(self.workers_var.get()))
+        except (tk.TclError, ValueError):
+            workers = engine.DEFAULT_WORKERS
+        mode = self.export_mode_var.get()
+        verify = self.verify_var.get()
+        self.export_job['verify'] = verify
+        link_duplicates = None
+        if self.duplicate_mode_var.get() == 'link':
+            link_duplicates = dict(self.current_duplicates())
+        format_type = self.format_var.get()
+        
+        def worker():
+            log = None
+            if self.journal is not None:
+                try:
+                    log = self.journal.start()
+                except OSError:
+                    log = None
+            options = dict(delete_originals=delete_originals,
+                           progress=progress,
+                           cancel=self.export_cancel,
+                           workers=workers,
+                           mode=mode,
+                           link_duplicates=link_duplicates,
+                           verify=verify,
+                           log=log)
+            try:
+                if sync:
+                    # Compare against the existing export first; only the
+                    # differences are handed to the copy pool
+                    changes = engine.plan_sync(plan, output_dir, base_name, format_type, workers=workers)
+                    self.export_queue.put(('progress', 0, len(changes.copy), 0))
+                    record = engine.sync_export(changes, output_dir, prune=prune, **options)
+                else:
+                    record = engine.execute_plan(plan, output_dir, on_conflict=on_conflict, **options)
+                self.export_queue.put(('done', record))
+            except engine.CollisionError as e:
+                self.export_queue.put(('collision', e.collisions))
+            except Exception as e:
+                self.export_queue.put(('error', e, getattr(e, 'record', None)))
+        
+        # Lock the controls that would change the plan mid-export
+        self.rename_btn.config(state='disabled')
+        self.progress_bar.config(maximum=max(len(plan), 1), value=0)
+        self.cancel_btn.config(state='normal')
+        self.progress_bar.pack(side='right', padx=(8, 0))
+        self.cancel_btn.pack(side='right', padx=(8, 0))
+        self.progress_label.config(text="Starting export...", fg=self.colors['primary'])
+        self.update_status(f"Exporting {len(plan)} files...", 'info')
+        
+        self.export_thread = threading.Thread(target=worker, daemon=True)
+        self.export_thread.start()
+        self.root.after(100, self.poll_export)
+    
+    def cancel_export(self):
+        """Ask the running export or undo to stop after the current file"""
+        if self.export_cancel is not None:
+            self.export_cancel.set()
+            self.cancel_btn.config(state='disabled')
+            self.update_status("Cancelling...", 'warning')
+    
+    def poll_export(self):
+        """Drain the export queue on the Tk thread; reschedules itself while running"""
+        job = self.export_job
+        finished = None
+        try:
+            while True:
+                message = self.export_queue.get_nowait()
+                if message[0] == 'progress':
+                    _, job['done'], job['total'], nbytes = message
+                    job['bytes'] += nbytes
+                else:
+                    finished = message
+                    break
+        except queue.Empty:
+            pass
+        
+        # Throughput and ETA from the totals so far
+        elapsed = max(time.monotonic() - job['started'], 1e-6)
+        files_per_sec = job['done'] / elapsed
+        mb_per_sec = job['bytes'] / elapsed / (1024 * 1024)
+        remaining = job['total'] - job['done']
+        eta = int(remaining / files_per_sec) if files_per_sec > 0 else 0
+        self.progress_bar.config(maximum=max(job['total'], 1), value=job['done'])
+        self.progress_label.config(
+            text=f"{job['done']}/{job['total']}  •  {files_per_sec:.1f} files/s  •  "
+                 f"{mb_per_sec:.1f} MB/s  •  ETA {eta // 60}:{eta % 60:02d}",
+            fg=self.colors['primary']
+        )
+        
+        if finished is None:
+            self.root.after(100, self.poll_export)
+            return
+        
+        self.finish_export(finished)
+    
+    def finish_export(self, message):
+        """Restore the controls and report the outcome of an export"""
+        job = self.export_job
+        self.export_thread = None
+        self.export_cancel = None
+        self.progress_bar.pack_forget()
+        self.cancel_btn.pack_forget()
+        self.rename_btn.config(state='normal' if self.preview_data else 'disabled')
+        output_dir = job['output_dir']
+        
+        if message[0] == 'collision':
+            collisions = message[1]
+            self.progress_label.config(text="")
+            self.update_status("Export aborted: name collision", 'error')
+            resume = self.ask_confirm(
+                "Name Collision",
+                f"{len(collisions)} files already exist in the output folder:\n\n"
+                + "\n".join(collisions[:5]) +
+                ("\n..." if len(collisions) > 5 else "") +
+                "\n\nIf an earlier export of these files was interrupted, OK resumes it: "
+                "files that match their source are kept and only the rest are copied. "
+                "Otherwise cancel and change the base name or remove the existing files."
+            )
+            if resume:
+                self.start_export(job['plan'], output_dir, job['base_name'],
+                                  job['delete_originals'], on_conflict='resume')
+            return
+        
+        if message[0] == 'error':
+            _, error, partial = message
+            # Keep whatever was exported before the failure undoable
+            if partial and partial['changes']:
+                self.rename_history.append(partial)
+            self.progress_label.config(text="")
+            self.update_status(f"Error during export: {str(error)}", 'error')
+            self.show_error(
+                "Export Error",
+                f"An error occurred during export:\n\n{str(error)}\n\n"
+                "Some files may have been exported. Please check the output folder."
+            )
+            return
+        
+        rename_record = message[1]
+        mismatches = []
+        for old_path, error in rename_record['errors']:
+            # Log but continue; the other files are exported
+            if error.startswith(engine.CHECKSUM_MISMATCH):
+                mismatches.append((old_path, error))
+                print(f"Verification failed for {old_path}: {error}")
+            elif error.endswith("original kept"):
+                # Size check after copying failed; the original was not deleted
+                print(f"Incomplete copy of {old_path}: {error}")
+            elif error == engine.FOLDER_IN_THE_WAY:
+                print(f"Skipped {old_path}: {error}")
             else:
-                export_base = os.path.dirname(os.path.abspath(__file__))
-            
-            output_dir = os.path.join(export_base, base_name)
-            os.makedirs(output_dir, exist_ok=True)
-            
-            # Check for name collisions in output folder
-            collisions = []
-            for _, new_name in self.preview_data:
-                target_path = os.path.join(output_dir, new_name)
-                if os.path.exists(target_path):
-                    collisions.append(new_name)
-            if collisions:
-                self.show_error(
-                    "Name Collision",
-                    "Some files already exist in the output folder:\n\n"
-                    + "\n".join(collisions[:10]) +
-                    ("\n..." if len(collisions) > 10 else "") +
-                    "\n\nPlease change the base name or remove existing files."
-                )
-                return
-            
-            # Store for undo capability (only if not deleting originals)
-            rename_record = {
-                'folder': output_dir,
-                'changes': [],
-                'timestamp': datetime.now(),
-                'deleted_originals': delete_originals
-            }
-            
-            # Perform copy + rename into output folder
-            success_count = 0
-            deleted_count = 0
-            for old_path, new_name in self.preview_data:
-                new_path = os.path.join(output_dir, new_name)
-                
-                # Check if file still exists
-                if os.path.exists(old_path):
-                    shutil.copy2(old_path, new_path)
-                    rename_record['changes'].append(new_path)
-                    success_count += 1
-                    
-                    # Delete original if option is enabled
-                    if delete_originals:
-                        try:
-                            os.remove(old_path)
-                            deleted_count += 1
-                        except Exception as del_err:
-                            # Log but continue if deletion fails
-                            print(f"Could not delete {old_path}: {del_err}")
-            
-            # Save to history (undo only works if originals weren't deleted)
+                print(f"Could not delete {old_path}: {error}")
+        
+        if mismatches:
+            self.show_warning(
+                "Verification Failed",
+                f"{len(mismatches)} copies do not match their source; those originals were kept:\n\n"
+                + "\n".join(os.path.basename(p) for p, _ in mismatches[:10]) +
+                ("\n..." if len(mismatches) > 10 else "") +
+                f"\n\nDetails are in {engine.MANIFEST_NAME} in the output folder."
+            )
+        
+        success_count = len(rename_record['changes'])
+        deleted_count = rename_record['deleted_count']
+        
+        # Save to history
+        if success_count or not rename_record['cancelled']:
             self.rename_history.append(rename_record)
+        
+        if rename_record['cancelled']:
+            self.progress_label.config(
+                text=f"⏹ Cancelled after {success_count} of {job['total']} files",
+                fg=self.colors['warning']
+            )
+            self.update_status(f"Export cancelled: {success_count} files exported", 'warning')
+            undo_hint = "You can undo the partial export using 'Undo' or Ctrl+Z."
+            self.show_warning(
+                "Export Cancelled",
+                f"Export stopped after {success_count} of {job['total']} files.\n\n"
+                f"Output folder:\n{output_dir}\n\n{undo_hint}"
+            )
+            return
+        
+        # Update UI
+        if job['delete_originals']:
+            self.progress_label.config(
+                text=f"✅ {success_count} exported, {deleted_count} originals deleted",
+                fg=self.colors['success']
+            )
+            self.update_status(f"Exported {success_count} files, deleted {deleted_count} originals", 'success')
             
-            # Update UI
-            if delete_originals:
-                self.progress_label.config(
-                    text=f"✅ {success_count} exported, {deleted_count} originals deleted",
-                    fg=self.colors['success']
-                )
-                self.update_status(f"Exported {success_count} files, deleted {deleted_count} originals", 'success')
-                
-                self.show_dialog(
-                    "Success",
-                    f"Successfully exported {success_count} image files!\n\n"
-                    f"Output folder:\n{output_dir}\n\n"
-                    f"Deleted {deleted_count} original files.\n\n"
-                    "Note: Deletion cannot be undone.",
-                    dialog_type='success'
-                )
-            else:
-                self.progress_label.config(
-                    text=f"✅ {success_count} files exported successfully!",
-                    fg=self.colors['success']
-                )
-                self.update_status(f"Successfully exported {success_count} files to {base_name}", 'success')
-                
-                self.show_dialog(
-                    "Success",
-                    f"Successfully exported {success_count} image files!\n\n"
-                    f"Output folder:\n{output_dir}\n\n"
-                    "You can undo this action using 'Undo Last' or Ctrl+Z.",
-                    dialog_type='success'
-                )
-            
-            self.reset_selection()
+            self.show_dialog(
+                "Success",
+                f"Successfully exported {success_count} image files!\n\n"
+                f"Output folder:\n{output_dir}\n\n"
+                f"Deleted {deleted_count} original files.\n\n"
+                "Undo ('Undo' or Ctrl+Z) moves the exported files back to the original folders.",
+                dialog_type='success'
+            )
+        else:
+            self.progress_label.config(
+                text=f"✅ {success_count} files exported successfully!",
+                fg=self.colors['success']
+            )
+            mb_per_sec = rename_record['bytes'] / max(rename_record['elapsed'], 1e-6) / (1024 * 1024)
+            details = f"{mb_per_sec:.1f} MB/s"
+            if job['verify']:
+                details += f", {rename_record['verified']} verified"
+            if rename_record['resumed']:
+                details += f", {rename_record['resumed']} already there"
+            if rename_record['skipped']:
+                details += f", {rename_record['skipped']} existing kept"
+            if 'unchanged' in rename_record:
+                details += f", {rename_record['unchanged']} unchanged"
+                if rename_record['pruned']:
+                    details += f", {rename_record['pruned']} stale removed"
+            self.update_status(f"Successfully exported {success_count} files to {job['base_name']} "
+                               f"({details})", 'success')
             
-        except Exception as e:
-            self.update_status(f"Error during export: {str(e)}", 'error')
-            self.show_error(
-                "Export Error",
-                f"An error occurred during export:\n\n{str(e)}\n\n"
-                "Some files may have been exported. Please check the output folder."
+            self.show_dialog(
+                "Success",
+                f"Successfully exported {success_count} image files!\n\n"
+                + (f"{rename_record['resumed']} files from the earlier run were already there.\n\n"
+                   if rename_record['resumed'] else "") +
+                f"Output folder:\n{output_dir}\n\n"
+                "You can undo this action using 'Undo Last' or Ctrl+Z.",
+                dialog_type='success'
             )
+        
+        self.reset_selection()
     
     def undo_last_rename(self):
         """Undo the last export operation"""
+        if self.export_thread is not None:
+            self.show_info("Export Running", "Please wait for the current export to finish.")
+            return
+        
         if not self.rename_history:
             self.show_info(
                 "Nothing to Undo",
@@ -893,77 +2004,362 @@ class ModernImageRenamer:
             )
             return
         
-        # Check if last operation deleted originals
-        last_op = self.rename_history[-1]
-        if last_op.get('deleted_originals', False):
-            self.show_warning(
-                "Cannot Undo",
-                "The last export operation deleted the original files.\n\n"
-                "This action cannot be undone. The exported files will remain in the output folder."
-            )
-            return
-        
+        self.undo_record(self.rename_history[-1], "the last export operation")
+    
+    def undo_record(self, record, description):
+        """Confirm, then undo one export from the history in the background"""
+        if self.export_thread is not None:
+            self.show_info("Export Running", "Please wait for the current export to finish.")
+            return False
+        
+        if record.get('deleted_originals', False):
+            detail = ("Exported files whose original was removed are moved back to the "
+                      "original folders; the other exported files are deleted.")
+        else:
+            detail = "This will delete the exported files."
         confirm = self.ask_confirm(
             "Confirm Undo",
-            "Do you want to undo the last export operation?\n\n"
-            "This will delete the exported files."
+            f"Do you want to undo {description}?\n\n{detail}"
         )
         
         if not confirm:
-            return
+            return False
+        
+        self.start_undo(record)
+        return True
+    
+    def start_undo(self, record):
+        """Run engine.undo_export on a worker thread with progress and cancel"""
+        undo_queue = queue.Queue()
+        cancel = threading.Event()
+        
+        def progress(done, total):
+            undo_queue.put(('progress', done, total))
         
         try:
-            # Get last operation
-            last_operation = self.rename_history.pop()
-            folder = last_operation['folder']
-            
-            # Reverse the changes by removing exported files
-            undo_count = 0
-            for new_path in last_operation['changes']:
-                if os.path.exists(new_path):
-                    os.remove(new_path)
-                    undo_count += 1
-            
-            # Remove empty output folder
-            if os.path.isdir(folder) and not os.listdir(folder):
-                os.rmdir(folder)
-            
-            self.update_status(f"Undone: removed {undo_count} exported files", 'success')
-            self.progress_label.config(
-                text=f"↩️ Removed {undo_count} exported files",
-                fg=self.colors['primary']
-            )
-            
-            # Rescan selection
-            self.scan_selection()
-            
-            self.show_dialog(
-                "Undo Complete",
-                f"Successfully removed {undo_count} exported files.\n\n"
-                "Your original files are intact.",
-                dialog_type='success'
-            )
+            workers = max(1, int(self.workers_var.get()))
+        except (tk.TclError, ValueError):
+            workers = engine.DEFAULT_WORKERS
+        
+        undone = None
+        if self.journal is not None and record.get('job'):
+            job_journal = self.journal
             
-        except Exception as e:
-            self.update_status(f"Undo error: {str(e)}", 'error')
+            def undone(targets):
+                # Lets an undo cut short by a crash resume after a restart
+                try:
+                    job_journal.mark_reverted(record['job'], targets)
+                except OSError:
+                    pass
+        
+        def worker():
+            try:
+                summary = engine.undo_export(record, progress=progress, cancel=cancel,
+                                             workers=workers, undone=undone)
+                undo_queue.put(('done', summary))
+            except Exception as e:
+                undo_queue.put(('error', e))
+        
+        total = len(record['changes'])
+        self.undo_queue = undo_queue
+        self.export_cancel = cancel
+        self.rename_btn.config(state='disabled')
+        self.progress_bar.config(maximum=max(total, 1), value=0)
+        self.cancel_btn.config(state='normal')
+        self.progress_bar.pack(side='right', padx=(8, 0))
+        self.cancel_btn.pack(side='right', padx=(8, 0))
+        self.progress_label.config(text="Starting undo...", fg=self.colors['primary'])
+        self.update_status(f"Undoing export of {total} files...", 'info')
+        
+        self.export_thread = threading.Thread(target=worker, daemon=True)
+        self.export_thread.start()
+        self.root.after(100, self.poll_undo, undo_queue, record)
+    
+    def poll_undo(self, undo_queue, record):
+        """Drain the undo queue on the Tk thread; reschedules itself while running"""
+        if undo_queue is not self.undo_queue:
+            return
+        finished = None
+        try:
+            while True:
+                message = undo_queue.get_nowait()
+                if message[0] == 'progress':
+                    _, done, total = message
+                    self.progress_bar.config(maximum=max(total, 1), value=done)
+                    self.progress_label.config(text=f"Undoing {done}/{total}",
+                                               fg=self.colors['primary'])
+                else:
+                    finished = message
+                    break
+        except queue.Empty:
+            pass
+        
+        if finished is None:
+            self.root.after(100, self.poll_undo, undo_queue, record)
+            return
+        
+        self.finish_undo(record, finished)
+        self.start_pending_rollback()
+    
+    def finish_undo(self, record, message):
+        """Restore the controls and report the outcome of an undo"""
+        self.undo_queue = None
+        self.export_thread = None
+        self.export_cancel = None
+        self.progress_bar.pack_forget()
+        self.cancel_btn.pack_forget()
+        self.rename_btn.config(state='normal' if self.preview_data else 'disabled')
+        self.forget_output_listing()
+        
+        if message[0] == 'error':
+            error = message[1]
+            self.progress_label.config(text="")
+            self.update_status(f"Undo error: {str(error)}", 'error')
             self.show_error(
                 "Undo Error",
-                f"An error occurred during undo:\n\n{str(e)}"
+                f"An error occurred during undo:\n\n{str(error)}"
             )
+            return
+        
+        summary = message[1]
+        if not record['changes']:
+            # Fully undone; partial undos stay in the history to finish later
+            if record in self.rename_history:
+                self.rename_history.remove(record)
+            if self.journal is not None and record.get('job'):
+                try:
+                    self.journal.mark_undone(record['job'])
+                except OSError:
+                    pass
+        
+        removed, restored = summary['removed'], summary['restored']
+        text = f"removed {removed} exported files"
+        if restored:
+            text += f", moved {restored} back to their original folders"
+        self.update_status(f"Undone: {text}", 'success' if not record['changes'] else 'warning')
+        self.progress_label.config(
+            text=f"↩️ {text[0].upper() + text[1:]}",
+            fg=self.colors['primary']
+        )
+        
+        # Rescan selection
+        self.scan_selection()
+        
+        if summary['cancelled'] or summary['errors']:
+            errors = summary['errors']
+            self.show_warning(
+                "Undo Incomplete",
+                f"Undo {'was cancelled' if summary['cancelled'] else 'stopped short'}: "
+                f"{text}, {len(record['changes'])} files left.\n\n"
+                + "".join(f"{os.path.basename(path)}: {error}\n" for path, error in errors[:5])
+                + ("...\n" if len(errors) > 5 else "")
+                + "\nRun Undo again to finish."
+            )
+            return
+        
+        self.show_dialog(
+            "Undo Complete",
+            f"Successfully {text}.\n\n"
+            "Your original files are intact.",
+            dialog_type='success'
+        )
+    
+    def load_history(self):
+        """Read the journal on a worker thread; poll_history takes the result"""
+        history_queue = queue.Queue()
+        job_journal = self.journal
+        
+        def worker():
+            try:
+                jobs = job_journal.jobs()
+                records = [job.record() for job in reversed(jobs) if job.state == 'complete']
+                history_queue.put(('done', records, job_journal.interrupted(jobs)))
+            except OSError as e:
+                history_queue.put(('error', e))
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, self.poll_history, history_queue)
+    
+    def poll_history(self, history_queue):
+        """Add the journal's finished jobs to rename_history and offer recovery"""
+        try:
+            message = history_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_history, history_queue)
+            return
+        if message[0] == 'error':
+            return
+        
+        _, records, interrupted = message
+        # Exports made while the journal was read are already in the list
+        known = {record.get('job') for record in self.rename_history}
+        self.rename_history.extend(record for record in records
+                                   if record['changes'] and record['job'] not in known)
+        self.rename_history.sort(key=lambda record: record['timestamp'])
+        if interrupted:
+            self.recover_interrupted_jobs(interrupted)
+    
+    def recover_interrupted_jobs(self, interrupted):
+        """Offer to keep or roll back exports that never finished.
+
+        Settling the jobs runs on a worker thread; rollbacks then go through
+        start_undo one after another (see poll_recovery).
+        """
+        if self.export_thread is not None:
+            # Offered again at the next start
+            return
+        
+        choices = []
+        for job in interrupted:
+            done = sum(1 for _, target in job.planned if target in job.completed)
+            rollback = self.ask_confirm(
+                "Interrupted Export",
+                f"An export started {job.timestamp:%Y-%m-%d %H:%M} did not finish "
+                f"({done} of {len(job.planned)} files recorded).\n\n"
+                f"Output folder:\n{job.folder}\n\n"
+                "OK rolls it back and removes the copies it made. "
+                "Cancel keeps them; the job stays in the History for a later undo."
+            )
+            choices.append((job, done, rollback))
+        
+        recovery_queue = queue.Queue()
+        job_journal = self.journal
+        
+        def worker():
+            results = []
+            for job, done, rollback in choices:
+                try:
+                    counts = job_journal.settle(job)
+                    # Settled as kept: a rollback is an ordinary undo from
+                    # here on, and whatever it can't undo stays in the History
+                    job_journal.mark_recovered(job.job_id)
+                    results.append((job.record(), done + counts['completed'], rollback, None))
+                except OSError as e:
+                    results.append((None, done, rollback, e))
+            recovery_queue.put(results)
+        
+        self.rename_btn.config(state='disabled')
+        self.update_status("Checking interrupted exports...", 'info')
+        self.export_thread = threading.Thread(target=worker, daemon=True)
+        self.export_thread.start()
+        self.root.after(100, self.poll_recovery, recovery_queue)
+    
+    def poll_recovery(self, recovery_queue):
+        """Report settled jobs and start undoing the ones to roll back"""
+        try:
+            results = recovery_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_recovery, recovery_queue)
+            return
+        
+        self.export_thread = None
+        self.rename_btn.config(state='normal' if self.preview_data else 'disabled')
+        for record, kept, rollback, error in results:
+            if error is not None:
+                self.show_error("Recovery Error", f"Could not recover the export:\n\n{str(error)}")
+                continue
+            if record['changes']:
+                self.rename_history.append(record)
+            if rollback:
+                self.pending_rollbacks.append(record)
+            else:
+                self.update_status(f"Kept interrupted export: {kept} files", 'warning')
+        self.rename_history.sort(key=lambda record: record['timestamp'])
+        self.start_pending_rollback()
+    
+    def start_pending_rollback(self):
+        """Undo the next recovered job the user chose to roll back"""
+        while self.pending_rollbacks and self.export_thread is None:
+            record = self.pending_rollbacks.pop(0)
+            if record['changes']:
+                self.start_undo(record)
+                return
+            if self.journal is not None:
+                # Nothing of it got as far as being recorded
+                try:
+                    self.journal.mark_undone(record['job'])
+                except OSError:
+                    pass
+    
+    def show_history(self):
+        """List past exports and undo any of them"""
+        if self.export_thread is not None:
+            self.show_info("Export Running", "Please wait for the current export to finish.")
+            return
+        
+        if not self.rename_history:
+            self.show_info("No History", "No export operations to undo.")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Export History")
+        dialog.configure(bg=self.colors['bg_card'])
+        dialog.transient(self.root)
+        dialog.geometry("620x360")
+        
+        content = tk.Frame(dialog, bg=self.colors['bg_card'])
+        content.pack(fill='both', expand=True, padx=16, pady=16)
+        
+        listbox = tk.Listbox(content,
+                             font=('Segoe UI', 9),
+                             bg='white',
+                             fg=self.colors['text_primary'],
+                             selectbackground=self.colors['selection'],
+                             selectforeground=self.colors['text_primary'],
+                             activestyle='none')
+        listbox.pack(side='left', fill='both', expand=True)
+        scrollbar = ttk.Scrollbar(content, orient='vertical', command=listbox.yview)
+        scrollbar.pack(side='right', fill='y')
+        listbox.config(yscrollcommand=scrollbar.set)
+        
+        # Newest first
+        records = list(reversed(self.rename_history))
+        for record in records:
+            note = "  (originals deleted)" if record.get('deleted_originals') else ""
+            listbox.insert('end', f"{record['timestamp']:%Y-%m-%d %H:%M}  •  "
+                                  f"{len(record['changes'])} files  •  {record['folder']}{note}")
+        listbox.selection_set(0)
+        
+        btn_frame = tk.Frame(dialog, bg=self.colors['bg_card'])
+        btn_frame.pack(fill='x', padx=16, pady=(0, 16))
+        
+        def undo_selected():
+            selection = listbox.curselection()
+            if not selection:
+                return
+            record = records[selection[0]]
+            if self.undo_record(record, f"the export of {len(record['changes'])} files "
+                                        f"from {record['timestamp']:%Y-%m-%d %H:%M}"):
+                # Progress is shown in the status bar
+                dialog.destroy()
+        
+        close_btn = ttk.Button(btn_frame,
+                              text="Close",
+                              command=dialog.destroy,
+                              style='Secondary.TButton')
+        close_btn.pack(side='right', padx=(8, 0))
+        
+        undo_btn = ttk.Button(btn_frame,
+                             text="Undo Selected",
+                             command=undo_selected,
+                             style='Primary.TButton')
+        undo_btn.pack(side='right')
     
     def clear_preview(self):
         """Clear the preview tree"""
-        for item in self.preview_tree.get_children():
-            self.preview_tree.delete(item)
+        if self.thumbnail_prefetcher:
+            self.thumbnail_prefetcher.cancel()
+        self.preview_view.clear()
         self.preview_data = []
-        self.preview_item_paths = {}
+        self.preview_source = None
+        self.preview_key = None
     
     def show_tree_menu(self, event):
         """Show right-click context menu"""
         # Select row under cursor
-        item = self.preview_tree.identify_row(event.y)
-        if item:
-            self.preview_tree.selection_set(item)
+        index = self.preview_view.index_at(event.y)
+        if index is not None:
+            self.preview_view.select_index(index)
             self.tree_menu.post(event.x_root, event.y_root)
     
     def preview_selected_image(self):
@@ -972,19 +2368,22 @@ class ModernImageRenamer:
     
     def remove_selected_images(self, event=None):
         """Remove selected images from the list"""
-        selected = self.preview_tree.selection()
+        selected = self.preview_view.selected_indexes()
         if not selected:
             return
         
-        # Get the file paths to remove
-        paths_to_remove = set()
-        for item_id in selected:
-            if item_id in self.preview_item_paths:
-                paths_to_remove.add(self.preview_item_paths[item_id])
+        selected = [index for index in selected if index < len(self.files_to_rename)]
         
-        # Remove from selected files and files_to_rename
-        self.selected_files = [f for f in self.selected_files if f not in paths_to_remove]
-        self.files_to_rename = [f for f in self.files_to_rename if f not in paths_to_remove]
+        # Remove from selected files (keyed by path) and files_to_rename (by index)
+        for index in selected:
+            self.selected_files.pop(self.files_to_rename[index], None)
+        if len(selected) < REMOVE_IN_PLACE_LIMIT:
+            # A few memmoves beat rebuilding a huge list
+            for index in reversed(selected):
+                del self.files_to_rename[index]
+        else:
+            doomed = set(selected)
+            self.files_to_rename[:] = [f for i, f in enumerate(self.files_to_rename) if i not in doomed]
         
         # Update the path entry
         if self.selected_files:
@@ -995,15 +2394,19 @@ class ModernImageRenamer:
         
         # Update file count
         count = len(self.files_to_rename)
-        removed_count = len(paths_to_remove)
+        removed_count = len(selected)
         if count > 0:
             self.file_count_label.config(
                 text=f"{count} image{'s' if count != 1 else ''} selected",
                 fg=self.colors['success']
             )
             self.clear_btn.config(state='normal')
-            # Refresh preview
-            self.preview_rename()
+            # The lazy plan renumbers itself; only the rows on screen are redrawn
+            self.preview_view.remove_indexes(selected)
+            if self.duplicates:
+                # A removed row may have been the first copy of a group
+                self.start_duplicate_scan()
+                self.preview_view.refresh()
             self.update_status(f"Removed {removed_count} image(s), {count} remaining", 'info')
         else:
             # No more files, reset
@@ -1012,7 +2415,12 @@ class ModernImageRenamer:
     
     def reset_selection(self):
         """Clear selected files and reset UI"""
-        self.selected_files = []
+        self.cancel_folder_scan()
+        self.sort_queue = None
+        self.similar_queue = None
+        self.selection_queue = None
+        self.forget_output_listing()
+        self.selected_files = {}
         self.files_to_rename = []
         self.current_folder = None
         self.clear_preview()
@@ -1049,6 +2457,10 @@ class ModernImageRenamer:
             self.export_path_var.set(display_path)
             self.reset_export_btn.config(state='normal')
             self.update_status(f"Export location set to: {directory}", 'success')
+            self.forget_output_listing()
+            if self.preview_data:
+                self.preview_key = None
+                self.auto_preview()
     
     def reset_export_location(self):
         """Reset export location to default (app directory)"""
@@ -1056,6 +2468,10 @@ class ModernImageRenamer:
         self.export_path_var.set("Default (App Directory)")
         self.reset_export_btn.config(state='disabled')
         self.update_status("Export location reset to default", 'info')
+        self.forget_output_listing()
+        if self.preview_data:
+            self.preview_key = None
+            self.auto_preview()
     
     def update_status(self, message, status_type='info'):
         """Update status bar with colored message"""
@@ -1226,6 +2642,7 @@ BASIC USAGE:
 
 KEYBOARD SHORTCUTS:
 • Ctrl+O: Select images
+• Ctrl+Shift+O: Select a folder (includes subfolders)
 • Ctrl+R: Preview changes
 • Ctrl+Z: Undo last rename
 • Delete/Backspace: Remove selected image
@@ -1235,17 +2652,18 @@ FEATURES:
 • Safe renaming with preview
 • Undo capability for peace of mind
 • Multiple naming format options
-• Automatic file sorting
+• Sort by path, file name, date taken, date modified or size
 • Real-time preview updates
 • Double-click a row to preview the image
 • Right-click to remove or preview image
-• Drag and drop images into the window
+• Drag and drop images or folders into the window
 • Clear button to reset selection
 • Option to delete originals after export
 • Customizable export location
 
 SUPPORTED FORMATS:
-JPG, JPEG, PNG, GIF, BMP, WEBP, TIFF
+JPG, JPEG, PNG, GIF, BMP, WEBP, TIFF, HEIC, AVIF, JPEG XL, RAW
+(detected from file contents, not the extension)
 
 EXPORT LOCATION:
 • Default: Files are exported to a folder next to this script
@@ -1255,15 +2673,15 @@ EXPORT LOCATION:
 
 DELETE ORIGINALS:
 • Check "Delete original files after export" to remove source files
-• WARNING: This action cannot be undone!
-• Original files are permanently deleted after successful export
+• Original files are removed after a successful export
+• Undo moves the exported files back to the original folders
 • Use with caution - make sure you have backups if needed
 
 TIPS:
 • Always preview before renaming
 • Use descriptive base names
-• Undo is available only if originals were NOT deleted
-• Files are sorted alphabetically before renaming
+• Undo and History work even after restarting the application
+• Files are numbered in the order chosen under "Order by"
         """
         
         help_window = tk.Toplevel(self.root)
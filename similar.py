@@ -0,0 +1,241 @@
+"""Perceptual near-duplicate clustering.
+
+Each image is decoded at thumbnail size (see thumbnails) and reduced to a
+64-bit perceptual hash; visually similar images (burst shots, re-saved or
+resized JPEGs) end up a few bits apart. The hash math runs on whole
+batches with NumPy, and near pairs are found with multi-index hamming
+buckets, so each image is only compared in full with the few that share
+a nearly identical 16-bit slice instead of with every other image.
+
+Needs Pillow and NumPy; check SIMILAR_AVAILABLE first.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except Exception:
+    NUMPY_AVAILABLE = False
+
+import thumbnails
+
+SIMILAR_AVAILABLE = NUMPY_AVAILABLE and thumbnails.PIL_AVAILABLE
+
+if thumbnails.PIL_AVAILABLE:
+    from PIL import Image
+
+# Hash methods and the grayscale size (width, height) each one starts from:
+#   ahash - pixels brighter than the mean
+#   dhash - brightness gradient between horizontal neighbours
+#   phash - low frequencies of the DCT, robust to recompression and resizing
+HASH_METHODS = {
+    'ahash': (8, 8),
+    'dhash': (9, 8),
+    'phash': (32, 32),
+}
+
+# Box images are decoded into before hashing
+DECODE_BOX = (64, 64)
+
+# Max differing bits (of 64) for two images to count as near duplicates;
+# up to 7 the multi-index search only probes 1-bit neighbours of each slice
+DEFAULT_THRESHOLD = 6
+
+DEFAULT_WORKERS = 4
+
+# Substrings the hash is split into for the multi-index search
+CHUNKS = 4
+
+# Set bits per byte value
+if NUMPY_AVAILABLE:
+    POPCOUNT = np.array([bin(v).count('1') for v in range(256)], dtype=np.uint8)
+
+
+def load_gray(path, size, cache=None):
+    """Grayscale pixels of path at size as a float32 array, or None.
+
+    cache may be a thumbnails.ThumbnailCache so repeated runs skip the decode.
+    """
+    try:
+        if cache is not None:
+            image = cache.load(path, DECODE_BOX)
+        else:
+            image = thumbnails.decode_thumbnail(path, DECODE_BOX)
+        image = image.convert('L').resize(size, Image.LANCZOS)
+    except Exception:
+        return None
+    return np.asarray(image, dtype=np.float32)
+
+
+def _pack(bits):
+    """N x 64 booleans -> list of N Python ints"""
+    packed = np.packbits(bits.reshape(len(bits), 64), axis=1)
+    return [int(v) for v in packed.view('>u8').ravel()]
+
+
+def ahash(pixels):
+    """Average hashes for an N x 8 x 8 stack"""
+    means = pixels.mean(axis=(1, 2), keepdims=True)
+    return _pack(pixels > means)
+
+
+def dhash(pixels):
+    """Difference hashes for an N x 8 x 9 stack"""
+    return _pack(pixels[:, :, 1:] > pixels[:, :, :-1])
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * x + 1) * k / (2 * n)).astype(np.float32)
+
+
+def phash(pixels):
+    """DCT hashes for an N x 32 x 32 stack"""
+    d = _dct_matrix(pixels.shape[1])
+    # D @ X @ D.T for every image at once
+    dct = np.matmul(np.matmul(d, pixels), d.T)
+    low = dct[:, :8, :8].reshape(len(pixels), 64)
+    medians = np.median(low, axis=1, keepdims=True)
+    return _pack(low > medians)
+
+
+HASH_FUNCTIONS = {'ahash': ahash, 'dhash': dhash, 'phash': phash}
+
+
+def compute_hashes(paths, method='phash', workers=DEFAULT_WORKERS, cache=None, cancel=None):
+    """Perceptual hash (int) of each path, None where it can't be decoded.
+
+    Decoding runs on a thread pool; the hashes are then computed for all
+    images in one vectorized pass.
+    """
+    if method not in HASH_METHODS:
+        raise ValueError(f"Unknown hash method: {method}")
+    size = HASH_METHODS[method]
+
+    def load(path):
+        if cancel is not None and cancel.is_set():
+            return None
+        return load_gray(path, size, cache)
+
+    paths = list(paths)
+    if workers and workers > 1 and len(paths) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pixels = list(pool.map(load, paths))
+    else:
+        pixels = [load(p) for p in paths]
+
+    loaded = [n for n, p in enumerate(pixels) if p is not None]
+    hashes = [None] * len(paths)
+    if loaded:
+        stack = np.stack([pixels[n] for n in loaded])
+        for n, value in zip(loaded, HASH_FUNCTIONS[method](stack)):
+            hashes[n] = value
+    return hashes
+
+
+def _masks(bits, radius):
+    """Every bits-wide mask with at most radius bits set"""
+    return [sum(1 << b for b in chosen)
+            for k in range(radius + 1) for chosen in combinations(range(bits), k)]
+
+
+def _popcount(values):
+    """Set bits of each uint64 in values"""
+    return POPCOUNT[values.view(np.uint8)].reshape(len(values), 8).sum(axis=1)
+
+
+def near_pairs(hashes, threshold=DEFAULT_THRESHOLD):
+    """(i, j) index arrays, i < j, of hashes at most threshold bits apart.
+
+    Multi-index hashing: the 64 bits are split into CHUNKS substrings, and
+    two hashes within threshold must have some substring within
+    threshold // CHUNKS bits of each other (pigeonhole). Each substring is
+    bucketed once and every such neighbour value is looked up for all
+    hashes at once; only the candidates found are compared in full.
+    """
+    h = np.asarray(hashes, dtype=np.uint64)
+    n = len(h)
+    width = 64 // CHUNKS
+    masks = _masks(width, threshold // CHUNKS)
+    found_i, found_j = [], []
+    for c in range(CHUNKS):
+        sub = ((h >> np.uint64(c * width)) & np.uint64((1 << width) - 1)).astype(np.int64)
+        order = np.argsort(sub, kind='stable')
+        # bucket[v]:bucket[v + 1] is where substring value v sits in order
+        bucket = np.searchsorted(sub[order], np.arange((1 << width) + 1))
+        for mask in masks:
+            keys = sub ^ mask
+            lo = bucket[keys]
+            counts = bucket[keys + 1] - lo
+            total = int(counts.sum())
+            if not total:
+                continue
+            # Expand each hash's bucket [lo, lo + count) into candidate pairs
+            i = np.repeat(np.arange(n), counts)
+            starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+            j = order[starts + np.arange(total)]
+            keep = i < j
+            i, j = i[keep], j[keep]
+            keep = _popcount(h[i] ^ h[j]) <= threshold
+            found_i.append(i[keep])
+            found_j.append(j[keep])
+    if not found_i:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(found_i), np.concatenate(found_j)
+
+
+def cluster(hashes, threshold=DEFAULT_THRESHOLD):
+    """Groups of indexes (2+) whose hashes chain together within threshold.
+
+    None entries are ignored. Groups and their members are in index order.
+    """
+    valid = [n for n, value in enumerate(hashes) if value is not None]
+    if not valid:
+        return []
+    # Identical hashes are searched once
+    unique, inverse = np.unique(np.array([hashes[n] for n in valid], dtype=np.uint64),
+                                return_inverse=True)
+    parent = list(range(len(unique)))
+
+    def find(n):
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+
+    for a, b in zip(*near_pairs(unique, threshold)):
+        a, b = find(int(a)), find(int(b))
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    groups = {}
+    for n, u in zip(valid, inverse.ravel()):
+        groups.setdefault(find(int(u)), []).append(n)
+    clusters = [members for members in groups.values() if len(members) > 1]
+    clusters.sort()
+    return clusters
+
+
+def find_similar(paths, method='phash', threshold=DEFAULT_THRESHOLD,
+                 workers=DEFAULT_WORKERS, cache=None, cancel=None):
+    """Groups of visually similar paths, each a list of 2+ paths in input order"""
+    paths = list(paths)
+    hashes = compute_hashes(paths, method, workers=workers, cache=cache, cancel=cancel)
+    if cancel is not None and cancel.is_set():
+        return []
+    return [[paths[n] for n in group] for group in cluster(hashes, threshold)]
+
+
+def group_together(paths, groups):
+    """paths reordered so each group's members follow its first member"""
+    members = {path for group in groups for path in group[1:]}
+    leaders = {group[0]: group[1:] for group in groups}
+
+    ordered = []
+    for path in paths:
+        if path in members:
+            continue
+        ordered.append(path)
+        ordered.extend(leaders.get(path, ()))
+    return ordered
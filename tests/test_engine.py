@@ -0,0 +1,196 @@
+"""Tests for engine.execute_plan's handling of names that already exist."""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def sources(tmp_path):
+    folder = tmp_path / 'src'
+    folder.mkdir()
+    paths = []
+    for i in range(2):
+        path = str(folder / f'img{i}.jpg')
+        write(path, b'source %d' % i)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def output_dir(tmp_path):
+    folder = tmp_path / 'out'
+    folder.mkdir()
+    return str(folder)
+
+
+def export(sources, output_dir, on_conflict, **options):
+    plan = engine.plan_rename(sources, 'Shoot', 'parentheses')
+    return engine.execute_plan(plan, output_dir, workers=1, on_conflict=on_conflict, **options)
+
+
+def test_suffix_skips_names_already_in_folder(sources, output_dir):
+    write(os.path.join(output_dir, 'Shoot (1).jpg'), b'first')
+    write(os.path.join(output_dir, 'Shoot (1) (2).jpg'), b'MINE')
+    record = export(sources, output_dir, 'suffix')
+
+    assert read(os.path.join(output_dir, 'Shoot (1) (2).jpg')) == b'MINE'
+    assert read(os.path.join(output_dir, 'Shoot (1) (3).jpg')) == b'source 0'
+    assert read(os.path.join(output_dir, 'Shoot (2).jpg')) == b'source 1'
+
+    engine.undo_export(record)
+    assert sorted(os.listdir(output_dir)) == ['Shoot (1) (2).jpg', 'Shoot (1).jpg']
+
+
+def test_abort_raises_before_copying(sources, output_dir):
+    write(os.path.join(output_dir, 'Shoot (2).jpg'), b'MINE')
+    with pytest.raises(engine.CollisionError):
+        export(sources, output_dir, 'abort')
+    assert os.listdir(output_dir) == ['Shoot (2).jpg']
+
+
+def test_skip_keeps_existing(sources, output_dir):
+    write(os.path.join(output_dir, 'Shoot (1).jpg'), b'MINE')
+    record = export(sources, output_dir, 'skip')
+
+    assert read(os.path.join(output_dir, 'Shoot (1).jpg')) == b'MINE'
+    assert read(os.path.join(output_dir, 'Shoot (2).jpg')) == b'source 1'
+    assert record['skipped'] == 1
+    assert record['changes'] == [os.path.join(output_dir, 'Shoot (2).jpg')]
+
+
+def test_newer_replaces_only_older_targets(sources, output_dir):
+    older = os.path.join(output_dir, 'Shoot (1).jpg')
+    newer = os.path.join(output_dir, 'Shoot (2).jpg')
+    write(older, b'old')
+    write(newer, b'new')
+    now = time.time()
+    os.utime(older, (now - 3600, now - 3600))
+    os.utime(newer, (now + 3600, now + 3600))
+    record = export(sources, output_dir, 'newer')
+
+    assert read(older) == b'source 0'
+    assert read(newer) == b'new'
+    assert record['skipped'] == 1
+
+
+def test_resume_keeps_finished_copies(sources, output_dir):
+    first = export(sources[:1], output_dir, 'abort')
+    partial = os.path.join(output_dir, 'Shoot (2).jpg')
+    write(partial, b'sou')
+    record = export(sources, output_dir, 'resume')
+
+    assert record['resumed'] == 1
+    assert record['changes'] == [partial]
+    assert read(partial) == b'source 1'
+    assert first['changes'] == [os.path.join(output_dir, 'Shoot (1).jpg')]
+
+
+def test_resume_keeps_manifest_method_of_linked_duplicates(tmp_path, output_dir):
+    sources = [str(tmp_path / 'a.jpg'), str(tmp_path / 'b.jpg')]
+    for path in sources:
+        write(path, b'same')
+    # The duplicate's mtime differs from its original's copy
+    os.utime(sources[1], (time.time() - 3600, time.time() - 3600))
+    links = {sources[1]: sources[0]}
+    export(sources, output_dir, 'abort', link_duplicates=links, verify=True)
+    export(sources, output_dir, 'resume', link_duplicates=links, verify=True)
+
+    manifest = engine.read_manifest(output_dir)
+    entry = manifest[os.path.join(output_dir, 'Shoot (2).jpg')]
+    assert entry['method'] == 'duplicate-link'
+    assert entry['status'] == 'verified'
+    plan = engine.plan_rename(sources, 'Shoot', 'parentheses')
+    sync = engine.plan_sync(plan, output_dir, 'Shoot', 'parentheses')
+    assert sync.copy == []
+
+
+def test_small_undo_reports_progress_per_worker_batch(tmp_path, output_dir):
+    sources = []
+    for i in range(40):
+        path = str(tmp_path / f'img{i}.jpg')
+        write(path, b'%d' % i)
+        sources.append(path)
+    record = export(sources, output_dir, 'abort')
+    calls = []
+    summary = engine.undo_export(record, progress=lambda done, total: calls.append(done), workers=4)
+
+    assert summary['removed'] == 40
+    assert len(calls) > 4
+    assert calls[-1] == 40
+    assert not os.path.exists(output_dir)
+
+
+def test_undo_after_partial_undo_counts_moved_back_files(sources, output_dir):
+    record = export(sources, output_dir, 'abort', delete_originals=True)
+    assert len(record['moves']) == 2
+    # An earlier undo moved the first file back, then stopped
+    engine._move_back(record['changes'][0], sources[0])
+    summary = engine.undo_export(record)
+
+    assert summary['errors'] == []
+    assert summary['restored'] == 1
+    assert all(os.path.exists(path) for path in sources)
+
+
+@pytest.mark.parametrize('on_conflict', ['resume', 'newer'])
+def test_folder_in_the_way_is_a_per_file_error(sources, output_dir, on_conflict):
+    os.mkdir(os.path.join(output_dir, 'Shoot (1).jpg'))
+    record = export(sources, output_dir, on_conflict)
+
+    assert record['errors'] == [(sources[0], engine.FOLDER_IN_THE_WAY)]
+    assert record['changes'] == [os.path.join(output_dir, 'Shoot (2).jpg')]
+    assert os.path.isdir(os.path.join(output_dir, 'Shoot (1).jpg'))
+
+
+def test_sync_after_plain_export_copies_only_inserted_file(tmp_path, output_dir):
+    sources = []
+    for i in range(5):
+        path = str(tmp_path / f'img{i}.jpg')
+        write(path, b'%d' % i)
+        sources.append(path)
+    export(sources[:2] + sources[3:], output_dir, 'abort')
+
+    plan = engine.plan_rename(sources, 'Shoot', 'parentheses')
+    sync = engine.plan_sync(plan, output_dir, 'Shoot', 'parentheses')
+    assert sync.copy == [(sources[2], 'Shoot (5).jpg')]
+    assert len(sync.unchanged) == 4
+
+
+def test_undo_keeps_manifest_entries_of_other_exports(sources, output_dir):
+    export(sources[:1], output_dir, 'abort')
+    record = export(sources, output_dir, 'skip')
+    engine.undo_export(record)
+
+    manifest = engine.read_manifest(output_dir)
+    assert list(manifest) == [os.path.join(output_dir, 'Shoot (1).jpg')]
+
+
+@pytest.mark.skipif(os.name != 'posix' or os.geteuid() == 0,
+                    reason="needs a folder the current user can't write to")
+def test_move_from_read_only_folder_copies_and_reports(sources, output_dir):
+    folder = os.path.dirname(sources[0])
+    os.chmod(folder, 0o555)
+    try:
+        record = export(sources, output_dir, 'abort', delete_originals=True)
+    finally:
+        os.chmod(folder, 0o755)
+
+    assert [path for path, _ in record['errors']] == sources
+    assert record['methods'] == {'copy': 2}
+    assert read(os.path.join(output_dir, 'Shoot (1).jpg')) == b'source 0'
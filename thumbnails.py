@@ -0,0 +1,365 @@
+"""Persistent thumbnail cache for image previews.
+
+Decoded previews are stored on disk keyed by the source's path, size and
+mtime plus the requested box, so an unchanged image is decoded once and
+every later preview is a small file read. The cache has a byte cap and
+evicts least recently used entries. LRUCache is a small in-memory map used
+by the GUI to keep recent PhotoImage objects around.
+"""
+import hashlib
+import io
+import os
+import queue
+import sys
+import threading
+from collections import OrderedDict, deque
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+import exif
+import formats
+
+# Default on-disk budget
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+# JPEG quality for cached thumbnails without transparency
+THUMBNAIL_QUALITY = 85
+
+# Image.thumbnail reduces on load to this multiple of the box before resampling
+REDUCING_GAP = 2.0
+
+# Part of every cache key; bumped when decoding changes so older entries
+# are made again instead of reused
+CACHE_FORMAT = 2
+
+# EXIF orientations that swap width and height once applied
+ORIENTATION_SWAPS_AXES = (5, 6, 7, 8)
+
+# EXIF orientation -> transpose operation that displays it upright
+if PIL_AVAILABLE:
+    ORIENTATION_TRANSPOSE = {
+        2: Image.FLIP_LEFT_RIGHT,
+        3: Image.ROTATE_180,
+        4: Image.FLIP_TOP_BOTTOM,
+        5: Image.TRANSPOSE,
+        6: Image.ROTATE_270,
+        7: Image.TRANSVERSE,
+        8: Image.ROTATE_90,
+    }
+else:
+    ORIENTATION_TRANSPOSE = {}
+
+
+def cache_root():
+    """Per-user cache folder for PhotoBatch"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'PhotoBatch')
+
+
+def default_cache_dir():
+    """Per-user cache folder for PhotoBatch thumbnails"""
+    return os.path.join(cache_root(), 'thumbnails')
+
+
+class LRUCache:
+    """Fixed-size mapping that drops the least recently used entry"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = OrderedDict()
+
+    def get(self, key):
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+
+class ThumbnailCache:
+    """Disk cache of downscaled images keyed by content identity"""
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_CACHE_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.total_bytes = None  # measured on first write
+        self.lock = threading.Lock()
+
+    def key(self, path, box):
+        """Cache key for path rendered into box (width, height); stats the file"""
+        st = os.stat(path)
+        ident = f"{CACHE_FORMAT}|{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{box[0]}x{box[1]}"
+        return hashlib.sha1(ident.encode('utf-8', 'surrogateescape')).hexdigest()
+
+    def entry_paths(self, key):
+        folder = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(folder, key + '.jpg'), os.path.join(folder, key + '.png')
+
+    def get(self, key):
+        """Cached PIL image for key, or None"""
+        for entry in self.entry_paths(key):
+            try:
+                image = Image.open(entry)
+                image.load()
+            except (OSError, ValueError):
+                continue
+            try:
+                # Touch so eviction sees it as recently used
+                os.utime(entry)
+            except OSError:
+                pass
+            return image
+        return None
+
+    def put(self, key, image):
+        """Store a downscaled image; failures only cost a cache miss later"""
+        jpg_path, png_path = self.entry_paths(key)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        target = png_path if has_alpha else jpg_path
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f"{target}.{threading.get_ident()}.tmp"
+            if has_alpha:
+                image.save(tmp, 'PNG')
+            else:
+                image.convert('RGB').save(tmp, 'JPEG', quality=THUMBNAIL_QUALITY)
+            os.replace(tmp, target)
+            written = os.path.getsize(target)
+        except OSError:
+            return
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = self.measure()
+            else:
+                self.total_bytes += written
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def load(self, path, box, decode=None):
+        """Thumbnail of path fitting box, from the cache or freshly decoded"""
+        key = self.key(path, box)
+        image = self.get(key)
+        if image is None:
+            image = (decode or decode_thumbnail)(path, box)
+            self.put(key, image)
+        return image
+
+    def entries(self):
+        """(mtime, size, path) for every cached file; mtime is bumped on use"""
+        found = []
+        try:
+            subdirs = list(os.scandir(self.cache_dir))
+        except OSError:
+            return found
+        for sub in subdirs:
+            if not sub.is_dir():
+                continue
+            try:
+                with os.scandir(sub.path) as it:
+                    for entry in it:
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        found.append((st.st_mtime, st.st_size, entry.path))
+            except OSError:
+                continue
+        return found
+
+    def measure(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Delete least recently used entries until below 90% of the cap"""
+        target = self.max_bytes * 0.9
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self.total_bytes = total
+
+
+class ThumbnailPrefetcher:
+    """Decodes thumbnails on a small worker pool, most wanted first.
+
+    schedule(paths) replaces the pending work with paths in priority order
+    (visible rows first, then the ones about to scroll in), keeping at most
+    max_pending of them; anything not started yet from an earlier call is
+    dropped. cancel() also invalidates work already in flight, for when the
+    list itself changes. Finished thumbnails land in ``results`` as
+    (generation, path, image) with image None on failure; consumers should
+    ignore generations older than ``generation`` and schedule those paths
+    again if they still want them, since schedule skips paths in flight.
+    """
+
+    def __init__(self, cache, box, workers=4, max_pending=256):
+        self.cache = cache
+        self.box = box
+        self.workers = workers
+        self.max_pending = max_pending
+        self.results = queue.Queue()
+        self.generation = 0
+        self.pending = deque()
+        self.inflight = set()
+        self.cond = threading.Condition()
+        self.threads = []
+
+    def schedule(self, paths):
+        """Replace pending work with paths, highest priority first"""
+        with self.cond:
+            self.pending.clear()
+            seen = set()
+            for path in paths:
+                if path in seen or path in self.inflight:
+                    continue
+                seen.add(path)
+                self.pending.append(path)
+                if len(self.pending) >= self.max_pending:
+                    break
+            self.start_workers()
+            self.cond.notify_all()
+
+    def cancel(self):
+        """Drop pending work and invalidate results still being decoded"""
+        with self.cond:
+            self.pending.clear()
+            self.generation += 1
+
+    def start_workers(self):
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(target=self.run, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                path = self.pending.popleft()
+                self.inflight.add(path)
+                generation = self.generation
+            try:
+                image = self.cache.load(path, self.box)
+            except Exception:
+                image = None
+            finally:
+                with self.cond:
+                    self.inflight.discard(path)
+            self.results.put((generation, path, image))
+
+
+def decode_thumbnail(path, box):
+    """Decode path at close to box size and shrink it to fit box.
+
+    Avoids full-resolution decodes where the file allows it:
+      - an embedded JPEG preview (EXIF thumbnail, RAW preview) big enough
+        for box is used instead of the main image
+      - JPEGs are decoded with draft(), which scales by 1/2..1/8 in the
+        decoder itself
+      - multi-resolution TIFFs use their smallest sufficient page
+    Anything else is reduced on load by Image.thumbnail's reducing_gap.
+    The EXIF orientation is applied last, so for turned images the stored
+    pixels are fitted into box with width and height swapped.
+    """
+    with open(path, 'rb') as f:
+        turn = exif.orientation(f)
+        if turn in ORIENTATION_SWAPS_AXES:
+            box = (box[1], box[0])
+        image = _embedded_preview(f, box)
+
+    if image is None:
+        image = Image.open(path)
+        if image.format == 'JPEG':
+            image.draft(None, box)
+        elif image.format == 'TIFF':
+            _pick_tiff_page(image, box)
+
+    image.thumbnail(box, Image.LANCZOS, reducing_gap=REDUCING_GAP)
+    if turn in ORIENTATION_TRANSPOSE:
+        image = image.transpose(ORIENTATION_TRANSPOSE[turn])
+    return image
+
+
+def _covers(size, box):
+    """True if an image of size still has to shrink to fit box"""
+    return size[0] >= box[0] or size[1] >= box[1]
+
+
+def _embedded_preview(f, box):
+    """Smallest embedded JPEG that covers box, loaded at draft size, or None.
+
+    For formats Pillow can't decode (RAW), the largest preview is used even
+    if it is smaller than box.
+    """
+    try:
+        found = exif.embedded_jpegs(f)
+    except (OSError, ValueError):
+        return None
+    if not found:
+        return None
+
+    candidates = []
+    for offset, length in found:
+        try:
+            f.seek(offset)
+            candidate = Image.open(io.BytesIO(f.read(length)))
+        except (OSError, ValueError, Image.DecompressionBombError):
+            continue
+        if candidate.format == 'JPEG':
+            candidates.append(candidate)
+    if not candidates:
+        return None
+
+    candidates.sort(key=lambda im: im.size[0] * im.size[1])
+    fitting = [im for im in candidates if _covers(im.size, box)]
+    if fitting:
+        chosen = fitting[0]
+    else:
+        f.seek(0)
+        if formats.sniff(f.read(formats.HEADER_SIZE)) not in ('raw', None):
+            return None
+        chosen = candidates[-1]
+
+    chosen.draft(None, box)
+    chosen.load()
+    return chosen
+
+
+def _pick_tiff_page(image, box):
+    """Seek a pyramid TIFF to its smallest page that still covers box"""
+    best = None
+    full = image.size
+    for frame in range(getattr(image, 'n_frames', 1)):
+        try:
+            image.seek(frame)
+        except EOFError:
+            break
+        w, h = image.size
+        # Only reduced copies of the same picture, not unrelated pages
+        same_shape = abs(w * full[1] - h * full[0]) <= max(w, h, 1) * full[1] * 0.02
+        if same_shape and _covers((w, h), box) and (best is None or w * h < best[1]):
+            best = (frame, w * h)
+    image.seek(best[0] if best else 0)
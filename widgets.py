@@ -0,0 +1,353 @@
+"""Reusable Tk widgets for PhotoBatch."""
+import bisect
+import tkinter as tk
+from tkinter import ttk
+
+
+class VirtualTreeview(tk.Frame):
+    """A Treeview that only holds the rows currently on screen.
+
+    The data lives outside the widget: set_rows(count, row_fn) registers how
+    many rows there are and a callback row_fn(index) -> (values, tags) that
+    builds one row on demand. The Treeview keeps a small pool of items that
+    is rewritten in place whenever the view scrolls, so 50k rows cost the
+    same to show as 30.
+
+    Selection is tracked by data index, so it survives scrolling; use
+    index_at(), selected_indexes() and select_index() instead of the
+    Treeview's item ids, which are recycled. The inner widget is exposed as
+    ``tree`` for headings, columns, styles and extra bindings.
+    """
+
+    # Rows moved per mouse wheel notch
+    WHEEL_ROWS = 3
+
+    def __init__(self, parent, rowheight=26, **tree_kwargs):
+        super().__init__(parent, bg=tree_kwargs.pop('bg', 'white'))
+        self.rowheight = rowheight
+        self.count = 0
+        self.row_fn = None
+        self.offset = 0
+        self.visible_rows = 1
+        self.pool = []
+        self.selected = set()
+        self.anchor = None
+        self.focus_index = None
+        # Called as on_view_change(offset, shown) after every redraw
+        self.on_view_change = None
+
+        self.scrollbar = tk.Scrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.pack(side='right', fill='y')
+
+        self.tree = ttk.Treeview(self, selectmode='extended', **tree_kwargs)
+        self.tree.pack(fill='both', expand=True)
+
+        self.tree.bind('<Configure>', self.on_configure)
+        self.tree.bind('<Button-1>', self.on_click)
+        self.tree.bind('<Shift-Button-1>', lambda e: self.on_click(e, extend=True))
+        self.tree.bind('<Control-Button-1>', lambda e: self.on_click(e, toggle=True))
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self.scroll_rows(-self.WHEEL_ROWS))
+        self.tree.bind('<Button-5>', lambda e: self.scroll_rows(self.WHEEL_ROWS))
+        self.tree.bind('<Up>', lambda e: self.move_focus(-1))
+        self.tree.bind('<Down>', lambda e: self.move_focus(1))
+        self.tree.bind('<Shift-Up>', lambda e: self.move_focus(-1, extend=True))
+        self.tree.bind('<Shift-Down>', lambda e: self.move_focus(1, extend=True))
+        self.tree.bind('<Prior>', lambda e: self.move_focus(-self.visible_rows))
+        self.tree.bind('<Next>', lambda e: self.move_focus(self.visible_rows))
+        self.tree.bind('<Home>', lambda e: self.move_focus(-self.count))
+        self.tree.bind('<End>', lambda e: self.move_focus(self.count))
+
+    # Data
+
+    def set_rows(self, count, row_fn):
+        """Replace the data source and reset selection and scroll position"""
+        self.count = count
+        self.row_fn = row_fn
+        self.offset = 0
+        self.selected = set()
+        self.anchor = None
+        self.focus_index = None
+        self.render()
+
+    def clear(self):
+        """Drop all rows"""
+        self.set_rows(0, None)
+
+    def set_count(self, count):
+        """Change the number of rows, keeping scroll position and selection"""
+        self.count = count
+        self.selected = {i for i in self.selected if i < count}
+        self.render()
+
+    def remove_indexes(self, indexes):
+        """Drop rows whose data was just removed from the source.
+
+        The row source must already reflect the removal. The view stays on
+        the same rows and the row after the first removed one is selected,
+        so pressing Delete repeatedly walks down the list.
+        """
+        removed = sorted(set(indexes))
+        if not removed:
+            return
+        self.count = max(0, self.count - len(removed))
+        self.offset -= bisect.bisect_left(removed, self.offset)
+        self.selected = set()
+        self.anchor = None
+        self.focus_index = None
+        if self.count:
+            self.select_index(min(removed[0], self.count - 1))
+        else:
+            self.render()
+
+    def refresh(self):
+        """Rebuild the rows on screen, e.g. after the data changed in place"""
+        self.render()
+
+    # Queries
+
+    def index_at(self, y):
+        """Data index of the row at widget y, or None"""
+        item_id = self.tree.identify_row(y)
+        return self.index_of(item_id)
+
+    def index_of(self, item_id):
+        """Data index shown by a pool item, or None"""
+        if not item_id or item_id not in self.pool:
+            return None
+        index = self.offset + self.pool.index(item_id)
+        return index if index < self.count else None
+
+    def selected_indexes(self):
+        """Selected data indexes in ascending order"""
+        return sorted(self.selected)
+
+    # Selection and scrolling
+
+    def select_index(self, index):
+        """Select a single row and scroll it into view"""
+        self.selected = {index}
+        self.anchor = index
+        self.focus_index = index
+        self.see(index)
+
+    def see(self, index):
+        """Scroll so that index is visible"""
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + self.visible_rows:
+            self.offset = index - self.visible_rows + 1
+        self.render()
+
+    def scroll_rows(self, delta):
+        self.offset += delta
+        self.render()
+        return 'break'
+
+    def on_scrollbar(self, *args):
+        if not self.count:
+            return
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * self.count)
+        elif args[0] == 'scroll':
+            step = self.visible_rows if args[2] == 'pages' else 1
+            self.offset += int(args[1]) * step
+        self.render()
+
+    def on_mousewheel(self, event):
+        # Windows reports multiples of 120 per notch, macOS small deltas
+        if abs(event.delta) >= 120:
+            notches = -event.delta // 120
+        else:
+            notches = -event.delta
+        return self.scroll_rows(notches * self.WHEEL_ROWS)
+
+    def on_click(self, event, extend=False, toggle=False):
+        # Let the Treeview handle headings and column separators itself
+        if self.tree.identify_region(event.x, event.y) not in ('cell', 'tree'):
+            return None
+        index = self.index_at(event.y)
+        if index is None:
+            return 'break'
+
+        self.tree.focus_set()
+        if extend and self.anchor is not None:
+            low, high = sorted((self.anchor, index))
+            self.selected = set(range(low, high + 1))
+        elif toggle:
+            self.selected ^= {index}
+            self.anchor = index
+        else:
+            self.selected = {index}
+            self.anchor = index
+        self.focus_index = index
+        self.render()
+        return 'break'
+
+    def move_focus(self, delta, extend=False):
+        if not self.count:
+            return 'break'
+        current = self.focus_index if self.focus_index is not None else self.offset - 1
+        index = max(0, min(self.count - 1, current + delta))
+        if extend and self.anchor is not None:
+            low, high = sorted((self.anchor, index))
+            self.selected = set(range(low, high + 1))
+            self.focus_index = index
+            self.see(index)
+        else:
+            self.select_index(index)
+        return 'break'
+
+    # Rendering
+
+    def on_configure(self, event):
+        rows = self.measure_rows(event.height)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.render()
+
+    def measure_rows(self, height):
+        """How many whole rows fit below the headings"""
+        heading = 0
+        if self.pool:
+            bbox = self.tree.bbox(self.pool[0])
+            if bbox:
+                heading = bbox[1]
+        if not heading:
+            heading = self.rowheight + 4
+        return max(1, (height - heading) // self.rowheight)
+
+    def render(self):
+        """Write the rows for the current offset into the item pool"""
+        self.offset = max(0, min(self.offset, self.count - self.visible_rows))
+        shown = min(self.visible_rows, self.count - self.offset)
+
+        while len(self.pool) < shown:
+            self.pool.append(self.tree.insert('', 'end'))
+        if len(self.pool) > shown:
+            self.tree.delete(*self.pool[shown:])
+            del self.pool[shown:]
+
+        selection = []
+        for slot, item_id in enumerate(self.pool):
+            index = self.offset + slot
+            values, tags = self.row_fn(index)
+            self.tree.item(item_id, values=values, tags=tags)
+            if index in self.selected:
+                selection.append(item_id)
+        self.tree.selection_set(selection)
+
+        if self.count:
+            first = self.offset / self.count
+            last = (self.offset + shown) / self.count
+            self.scrollbar.set(first, last)
+        else:
+            self.scrollbar.set(0, 1)
+
+        if self.on_view_change:
+            self.on_view_change(self.offset, shown)
+
+
+class ThumbnailGrid(tk.Frame):
+    """A grid of thumbnails drawn on a Canvas, one cell per data row.
+
+    The grid has no scroll state of its own: show(first) draws the cells
+    from data index ``first`` on, as many as fit. cell_fn(index) returns
+    (photo or None, caption, selected) for each visible cell; photos that
+    are not ready yet are drawn as a placeholder until redraw() is called.
+    Clicks and the mouse wheel are reported through the on_* callbacks.
+    """
+
+    def __init__(self, parent, thumb_size=(120, 90), bg='white', fg='#1A1A1A',
+                 select_bg='#B8D4E8', placeholder_bg='#E8E8E8', font=('Segoe UI', 8)):
+        super().__init__(parent, bg=bg)
+        self.thumb_size = thumb_size
+        self.cell_w = thumb_size[0] + 16
+        self.cell_h = thumb_size[1] + 30
+        self.colors = {'bg': bg, 'fg': fg, 'select': select_bg, 'placeholder': placeholder_bg}
+        self.font = font
+        self.first = 0
+        self.count = 0
+        self.cell_fn = None
+        self.on_click = None
+        self.on_double_click = None
+        self.on_wheel = None
+        self.on_resize = None
+
+        self.canvas = tk.Canvas(self, bg=bg, highlightthickness=0)
+        self.canvas.pack(fill='both', expand=True)
+        self.canvas.bind('<Configure>', self.handle_configure)
+        self.canvas.bind('<Button-1>', lambda e: self.report(self.on_click, e))
+        self.canvas.bind('<Double-1>', lambda e: self.report(self.on_double_click, e))
+        self.canvas.bind('<MouseWheel>', self.handle_mousewheel)
+        self.canvas.bind('<Button-4>', lambda e: self.on_wheel and self.on_wheel(-1))
+        self.canvas.bind('<Button-5>', lambda e: self.on_wheel and self.on_wheel(1))
+
+    @property
+    def columns(self):
+        return max(1, self.canvas.winfo_width() // self.cell_w)
+
+    @property
+    def capacity(self):
+        """Number of whole cells that fit"""
+        return self.columns * max(1, self.canvas.winfo_height() // self.cell_h)
+
+    def set_source(self, count, cell_fn):
+        self.count = count
+        self.cell_fn = cell_fn
+
+    def show(self, first, count=None):
+        """Draw cells starting at data index first"""
+        self.first = max(0, first)
+        if count is not None:
+            self.count = count
+        self.redraw()
+
+    def visible_indexes(self):
+        return range(self.first, min(self.count, self.first + self.capacity))
+
+    def index_at(self, x, y):
+        column = x // self.cell_w
+        if column >= self.columns:
+            return None
+        index = self.first + (y // self.cell_h) * self.columns + column
+        return index if index < self.count else None
+
+    def redraw(self):
+        self.canvas.delete('all')
+        if not self.cell_fn:
+            return
+        columns = self.columns
+        tw, th = self.thumb_size
+        for slot, index in enumerate(self.visible_indexes()):
+            x = (slot % columns) * self.cell_w
+            y = (slot // columns) * self.cell_h
+            photo, caption, selected = self.cell_fn(index)
+            if selected:
+                self.canvas.create_rectangle(x + 2, y + 2, x + self.cell_w - 2, y + self.cell_h - 2,
+                                             fill=self.colors['select'], outline='')
+            cx, cy = x + self.cell_w // 2, y + 8 + th // 2
+            if photo is not None:
+                self.canvas.create_image(cx, cy, image=photo)
+            else:
+                self.canvas.create_rectangle(cx - tw // 2, cy - th // 2, cx + tw // 2, cy + th // 2,
+                                             fill=self.colors['placeholder'], outline='')
+            if len(caption) > 20:
+                caption = caption[:9] + '…' + caption[-10:]
+            self.canvas.create_text(cx, y + th + 18, text=caption, fill=self.colors['fg'],
+                                    font=self.font)
+
+    def report(self, callback, event):
+        index = self.index_at(event.x, event.y)
+        if callback and index is not None:
+            callback(index)
+
+    def handle_mousewheel(self, event):
+        if self.on_wheel:
+            self.on_wheel(-1 if event.delta > 0 else 1)
+
+    def handle_configure(self, event):
+        if self.on_resize:
+            self.on_resize()
+        else:
+            self.redraw()